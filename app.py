@@ -3,7 +3,13 @@
 import streamlit as st
 import re
 import os
-from services import jira_service, claude_service as ai_service, salesforce_service
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from services import jira_service, jira_outbox, salesforce_service, dependency_analyzer, codegen_scheduler
 from ui_components import chat_view
 
 st.set_page_config(page_title="Design Orchestrator", layout="wide", initial_sidebar_state="auto")
@@ -17,9 +23,11 @@ if 'jira_ticket_id' not in st.session_state: st.session_state.jira_ticket_id = N
 if 'url_processed' not in st.session_state: st.session_state.url_processed = False
 if 'questions_to_ask' not in st.session_state: st.session_state.questions_to_ask = []
 if 'files_to_generate' not in st.session_state: st.session_state.files_to_generate = []
+if 'file_dependencies' not in st.session_state: st.session_state.file_dependencies = {}
 if 'generated_code_files' not in st.session_state: st.session_state.generated_code_files = {}
 if "messages" not in st.session_state: st.session_state.messages = [{"role": "assistant", "content": "Hello! How can I help you design a Salesforce solution today?"}]
 if "schema_context" not in st.session_state: st.session_state.schema_context = "No schema context available."
+if "schema_context_provenance" not in st.session_state: st.session_state.schema_context_provenance = None
 if "debug_info" not in st.session_state: st.session_state.debug_info = {}
 if 'ai_provider' not in st.session_state: st.session_state.ai_provider = "Claude"
 
@@ -32,12 +40,18 @@ with st.sidebar:
         index=0 if st.session_state.ai_provider == "Claude" else 1
     )
     st.caption("The app will use this model for all generations.")
+    st.toggle("Reuse cached AI responses", value=True, key="llm_cache_enabled",
+              help="Identical requests within the cache TTL are answered instantly from the response cache. Turn off to force fresh generations.")
 
     if st.session_state.ai_provider == "Claude" and not st.secrets.get("ANTHROPIC_API_KEY"):
         st.error("Anthropic API key is not set in your secrets!")
     elif st.session_state.ai_provider == "OpenAI" and not st.secrets.get("OPENAI_API_KEY"):
         st.error("OpenAI API key is not set in your secrets!")
 
+    outbox_counts = jira_outbox.get_outbox().counts()
+    if outbox_counts.get("pending") or outbox_counts.get("failed"):
+        st.caption(f"Jira write-backs: {outbox_counts.get('pending', 0)} queued, {outbox_counts.get('failed', 0)} failed.")
+
 # --- Dynamic AI Service Loading ---
 if st.session_state.ai_provider == "Claude":
     from services import claude_service as ai_service
@@ -51,30 +65,89 @@ with wizard_tab:
     st.header("Wizard Mode")
     
     def get_schema_context_from_cache():
+        # Schema context is derived from the story, the provider that extracts its entities,
+        # the retrieval mode and the published schema cache version, so it is only rebuilt
+        # when one of those changes, not on every step that needs it.
+        semantic = salesforce_service.is_semantic_retrieval_enabled()
+        schema_version = salesforce_service.get_schema_cache_version()
+        story_key = hashlib.sha256(
+            f"{st.session_state.ai_provider}\n{semantic}\n{schema_version}\n{st.session_state.user_story}".encode("utf-8")
+        ).hexdigest()
+        provenance = st.session_state.schema_context_provenance
+        if provenance and provenance["story_key"] == story_key:
+            return
         st.session_state.debug_info = {}
-        with st.spinner("Step 1/3: Asking AI to identify relevant Salesforce objects..."):
-            sfdc_objects_from_ai = ai_service.extract_entities_from_story(st.session_state.user_story)
-        st.session_state.debug_info["1a_AI_Suggested_Entities"] = sfdc_objects_from_ai
+        source = build_schema_context()
+        if source is None:
+            # Nothing usable was built (e.g. Redis was down); try again on the next step.
+            st.session_state.schema_context_provenance = None
+            return
+        st.session_state.schema_context_provenance = {
+            "story_key": story_key,
+            "provider": st.session_state.ai_provider,
+            "source": source,
+            "schema_version": schema_version,
+            "built_at": datetime.now(timezone.utc).isoformat(timespec="seconds")
+        }
+        st.session_state.debug_info["0_Schema_Context_Provenance"] = st.session_state.schema_context_provenance
+
+    def build_schema_context():
+        """Fills st.session_state.schema_context and returns where it came from, or None if no schema was found."""
+        if salesforce_service.is_semantic_retrieval_enabled():
+            with st.spinner("Step 1/2: Searching the metadata index for relevant Salesforce objects..."):
+                schema_context_str, debug_data = salesforce_service.get_schema_context_from_vectors(st.session_state.user_story)
+            st.session_state.debug_info.update(debug_data)
+            if schema_context_str is not None:
+                st.session_state.schema_context = schema_context_str
+                return "metadata_index"
+
+        # The keyword matches are known instantly, so their schemas are prefetched from Redis
+        # while the AI call runs; the lookup below then only fetches what the AI adds.
         sfdc_objects_from_keyword = salesforce_service.extract_sfdc_objects_by_keyword(st.session_state.user_story)
+        script_ctx = get_script_run_ctx()
+        with ThreadPoolExecutor(max_workers=1, initializer=lambda: add_script_run_ctx(threading.current_thread(), script_ctx)) as executor:
+            stage_started = time.perf_counter()
+            prefetch = executor.submit(timed_call, salesforce_service.prefetch_object_schemas, sfdc_objects_from_keyword)
+            with st.spinner("Step 1/3: Asking AI to identify relevant Salesforce objects..."):
+                sfdc_objects_from_ai = ai_service.extract_entities_from_story(st.session_state.user_story)
+            ai_ms = (time.perf_counter() - stage_started) * 1000
+            prefetched_objects, prefetch_ms = prefetch.result()
+        st.session_state.debug_info["1a_AI_Suggested_Entities"] = sfdc_objects_from_ai
         st.session_state.debug_info["1b_Keyword_Suggested_Entities"] = sfdc_objects_from_keyword
+        st.session_state.debug_info["1d_Prefetched_Keyword_Schemas"] = prefetched_objects
+        st.session_state.debug_info["1e_Step_1_Timings_ms"] = {
+            "ai_extraction": round(ai_ms, 1), "keyword_prefetch": round(prefetch_ms, 1),
+            "step_total": round((time.perf_counter() - stage_started) * 1000, 1)
+        }
         combined_objects = sorted(list(set(sfdc_objects_from_ai + sfdc_objects_from_keyword)))
         st.session_state.debug_info["1c_Combined_Entities_List"] = combined_objects
 
         if not combined_objects:
             st.warning("Could not identify any potential Salesforce objects. Proceeding without org context.")
             st.session_state.schema_context = "No schema context available."
-            return
+            return None
         
         with st.spinner(f"Step 2/3: Searching cache for schemas related to: {', '.join(combined_objects)}..."):
             schema_context_str, debug_data = salesforce_service.get_org_schema_for_objects(combined_objects)
             st.session_state.schema_context = schema_context_str
             st.session_state.debug_info.update(debug_data)
+        # Errors and misses leave "4_Final_Schema_Context" unset or "None".
+        if debug_data.get("4_Final_Schema_Context") in (None, "None"):
+            return None
+        return "redis_schema_cache"
+
+    def timed_call(func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        return result, (time.perf_counter() - started) * 1000
 
     def handle_jira_fetch(ticket_id):
         with st.spinner(f"Fetching {ticket_id} from Jira..."):
             story_text = jira_service.fetch_story(ticket_id)
             if story_text:
                 st.session_state.update(user_story=story_text, jira_ticket_id=ticket_id, solution_overview="", technical_solution="", questions_to_ask=[], files_to_generate=[], generated_code_files={})
+                # The version the user is working from; the write-back is refused if the issue moves on.
+                st.session_state.jira_ticket_updated = jira_service.story_version(ticket_id)
                 st.success(f"Successfully fetched story for {ticket_id}!")
 
     issue_key_from_url = st.query_params.get("issueKey")
@@ -118,14 +191,14 @@ with wizard_tab:
                     if q.get("type", "single") == "multiple": user_answers[q['question']] = st.multiselect(q['question'], options=q['options'], key=f"q_{i}")
                     else: user_answers[q['question']] = st.radio(q['question'], options=q['options'], key=f"q_{i}")
                 if st.form_submit_button("Submit Answers & Generate Solution"):
-                    with st.spinner("🧠 Thanks! Regenerating solution..."):
-                        context_lines = []
-                        for question, answer in user_answers.items():
-                            formatted_answer = ", ".join(answer) if isinstance(answer, list) and answer else "None selected" if isinstance(answer, list) else answer
-                            context_lines.append(f"- Regarding '{question}', the user specified: '{formatted_answer}'")
-                        st.session_state.solution_overview = ai_service.generate_solution_with_answers(st.session_state.user_story, "\n".join(context_lines), st.session_state.schema_context)
-                        st.session_state.questions_to_ask = []
-                        st.rerun()
+                    st.caption("🧠 Thanks! Regenerating solution...")
+                    context_lines = []
+                    for question, answer in user_answers.items():
+                        formatted_answer = ", ".join(answer) if isinstance(answer, list) and answer else "None selected" if isinstance(answer, list) else answer
+                        context_lines.append(f"- Regarding '{question}', the user specified: '{formatted_answer}'")
+                    st.session_state.solution_overview = st.write_stream(ai_service.stream_solution_with_answers(st.session_state.user_story, "\n".join(context_lines), st.session_state.schema_context))
+                    st.session_state.questions_to_ask = []
+                    st.rerun()
 
     # --- OUTPUT SECTION ---
     if st.session_state.solution_overview:
@@ -139,12 +212,12 @@ with wizard_tab:
             st.divider()
             if st.button("Generate Technical Solution", type="primary", use_container_width=True):
                 get_schema_context_from_cache()
-                with st.spinner("🛠️ The Technical Architect AI is designing..."):
-                    st.session_state.technical_solution = ai_service.generate_technical_solution(st.session_state.user_story, st.session_state.solution_overview, st.session_state.schema_context)
-                    st.session_state.files_to_generate, st.session_state.generated_code_files = [], {}
-                    # MODIFIED: Add a success message to guide the user
-                    st.success("Technical Solution generated! Click the 'Technical Solution' tab to view and edit it. 👉")
-                    st.rerun()
+                st.caption("🛠️ The Technical Architect AI is designing...")
+                st.session_state.technical_solution = st.write_stream(ai_service.stream_technical_solution(st.session_state.user_story, st.session_state.solution_overview, st.session_state.schema_context))
+                st.session_state.files_to_generate, st.session_state.generated_code_files = [], {}
+                # MODIFIED: Add a success message to guide the user
+                st.success("Technical Solution generated! Click the 'Technical Solution' tab to view and edit it. 👉")
+                st.rerun()
 
         with tech_tab:
             if st.session_state.technical_solution:
@@ -154,15 +227,23 @@ with wizard_tab:
                 with col1:
                     if st.button("Prepare Code Generation"):
                         with st.spinner("Parsing technical solution and analyzing dependencies..."):
+                            st.session_state.debug_info.pop("6b_Dependency_Cycles", None)
                             st.session_state.debug_info["4_Text_For_Filename_Parsing"] = st.session_state.technical_solution
-                            filenames = re.findall(r'(\w+\.(?:cls|trigger|xml|js|html|css))', st.session_state.technical_solution)
+                            filenames = re.findall(r'(\w+\.(?:cls|trigger|js|html|css)(?:-meta\.xml)?|\w+\.xml)\b', st.session_state.technical_solution)
                             st.session_state.debug_info["5_Regex_Found_Filenames"] = filenames
                             if filenames:
-                                sorted_filenames = ai_service.get_generation_order(filenames)
+                                # Code from a previous generation run, if any, adds Apex class reference edges.
+                                sorted_filenames, dependencies, cycles = dependency_analyzer.generation_order(filenames, st.session_state.generated_code_files)
+                                st.session_state.debug_info["6_Dependency_Edges"] = {f: sorted(deps) for f, deps in dependencies.items() if deps}
+                                if cycles:
+                                    st.session_state.debug_info["6b_Dependency_Cycles"] = cycles
+                                    if st.secrets.get("AI_DEPENDENCY_ORDER_FALLBACK", False):
+                                        sorted_filenames = ai_service.get_generation_order(sorted_filenames)
                                 st.session_state.files_to_generate = sorted_filenames
-                                st.session_state.debug_info["6_AI_Sorted_Filenames"] = sorted_filenames
+                                st.session_state.file_dependencies = dependencies
+                                st.session_state.debug_info["6_Sorted_Filenames"] = sorted_filenames
                             else:
-                                st.session_state.files_to_generate = []
+                                st.session_state.files_to_generate, st.session_state.file_dependencies = [], {}
                             st.session_state.generated_code_files = {}
                         st.rerun()
                 
@@ -170,20 +251,44 @@ with wizard_tab:
                     if st.button("Generate All Files", type="primary", disabled=not st.session_state.files_to_generate):
                         st.session_state.generated_code_files = {}
                         full_context = f"USER STORY:\n{st.session_state.user_story}\n\nSOLUTION OVERVIEW:\n{st.session_state.solution_overview}\n\nTECHNICAL SOLUTION:\n{st.session_state.technical_solution}"
+                        files = st.session_state.files_to_generate
+                        # The map built in Prepare, including the edges found in previously generated code.
+                        dependencies = st.session_state.file_dependencies
                         progress_bar = st.progress(0, text="Starting code generation...")
-                        
-                        for i, filename in enumerate(st.session_state.files_to_generate):
-                            progress_text = f"Generating file {i+1}/{len(st.session_state.files_to_generate)}: `{filename}`"
-                            st.info(progress_text)
-                            generated_code = ai_service.generate_single_file_code(full_context, filename)
-                            st.session_state.generated_code_files[filename] = generated_code
-                            progress_bar.progress((i + 1) / len(st.session_state.files_to_generate), text=progress_text)
-                        
-                        st.success("✅ Code generation complete!")
+                        file_status = {}
+                        for filename in files:
+                            file_status[filename] = st.empty()
+                            waiting_on = ", ".join(f"`{d}`" for d in sorted(dependencies.get(filename, ())))
+                            file_status[filename].info(f"⏳ `{filename}`" + (f" (waits for {waiting_on})" if waiting_on else ""))
+
+                        # Worker threads need the script context so the services can still report errors in the UI.
+                        script_ctx = get_script_run_ctx()
+                        generated, failed = {}, []
+                        for filename, generated_code, error in codegen_scheduler.generate_files(
+                            lambda name, dependency_code: ai_service.generate_single_file_code(full_context, name, dependency_code),
+                            files, dependencies, max_workers=ai_service.MAX_CONCURRENT_REQUESTS,
+                            thread_initializer=lambda: add_script_run_ctx(threading.current_thread(), script_ctx)
+                        ):
+                            if error or not generated_code or generated_code.startswith("// Error generating code"):
+                                failed.append(filename)
+                                file_status[filename].error(f"❌ `{filename}` failed: {error or 'see the error above'}")
+                            else:
+                                file_status[filename].success(f"✅ `{filename}`")
+                            generated[filename] = generated_code or f"// Error generating code for {filename}: {error}"
+                            progress_bar.progress(len(generated) / len(files), text=f"Generated {len(generated)}/{len(files)} files")
+
+                        st.session_state.generated_code_files = {filename: generated[filename] for filename in files}
+                        if failed:
+                            st.warning(f"Code generation finished with {len(failed)} failed file(s): {', '.join(failed)}")
+                        else:
+                            st.success("✅ Code generation complete!")
                 
                 if st.session_state.files_to_generate:
                     st.write("**Generation Plan (in order):**")
                     st.write(" ➡️ ".join(f"`{name}`" for name in st.session_state.files_to_generate))
+                    cycles = st.session_state.debug_info.get("6b_Dependency_Cycles")
+                    if cycles:
+                        st.warning("Circular dependencies found between " + "; ".join(" ↔ ".join(f"`{f}`" for f in cycle) for cycle in cycles) + ". Those files are generated last.")
             else:
                 st.info("A technical solution must be generated before you can prepare or generate code.")
 
@@ -212,13 +317,34 @@ with wizard_tab:
                 st.rerun()
         with col4:
             if st.button("Confirm to Jira", use_container_width=True, disabled=not st.session_state.get("jira_ticket_id"), help="This option is only available for stories fetched directly from Jira."):
-                with st.spinner("Appending solutions to Jira ticket..."):
-                    text_to_append = f"""\n\nh2. Generated by Rocket AI 🚀\n{{panel:title=Solution Direction|borderColor=#82B5F8}}\n{st.session_state.solution_overview}\n{{panel}}\n{{panel:title=Technical Solution|borderColor=#4285F4}}\n{{code:language=markdown}}\n{st.session_state.technical_solution}\n{{code}}\n{{panel}}"""
-                    jira_service.update_story_description(st.session_state.jira_ticket_id, text_to_append)
+                text_to_append = f"""\n\nh2. Generated by Rocket AI 🚀\n{{panel:title=Solution Direction|borderColor=#82B5F8}}\n{st.session_state.solution_overview}\n{{panel}}\n{{panel:title=Technical Solution|borderColor=#4285F4}}\n{{code:language=markdown}}\n{st.session_state.technical_solution}\n{{code}}\n{{panel}}"""
+                # Queued, not written inline: the outbox worker applies it in the background.
+                jira_outbox.get_outbox().enqueue(st.session_state.jira_ticket_id, text_to_append, st.session_state.get("jira_ticket_updated"))
+                st.success(f"Queued the solutions for {st.session_state.jira_ticket_id}; they'll be appended to the ticket in the background.")
+            if st.session_state.get("jira_ticket_id"):
+                outbox_entries = jira_outbox.get_outbox().entries(st.session_state.jira_ticket_id, limit=5)
+                for entry in outbox_entries:
+                    if entry["status"] == "applied":
+                        st.caption(f"✅ Write-back #{entry['id']} applied to {entry['ticket_id']}.")
+                    elif entry["status"] == "failed":
+                        st.caption(f"❌ Write-back #{entry['id']} failed after {entry['attempts']} attempt(s): {entry['last_error']}")
+                    elif entry["attempts"]:
+                        st.caption(f"⏳ Write-back #{entry['id']} retrying in {max(0, round(entry['next_attempt'] - time.time()))}s (attempt {entry['attempts']} failed: {entry['last_error']})")
+                    else:
+                        st.caption(f"⏳ Write-back #{entry['id']} queued.")
+                if outbox_entries and st.button("Refresh write-back status", use_container_width=True):
+                    st.rerun()
 
-    if st.session_state.debug_info:
+    if st.session_state.debug_info or st.session_state.get("llm_metrics"):
         with st.expander("🔍 Show Debug Panel", expanded=False):
             st.json(st.session_state.debug_info)
+            if st.session_state.get("llm_metrics"):
+                st.write("**LLM call latency (most recent last):**")
+                st.dataframe(st.session_state.llm_metrics, use_container_width=True)
+                cache_read = sum(m.get("cache_read_tokens") or 0 for m in st.session_state.llm_metrics)
+                cache_write = sum(m.get("cache_write_tokens") or 0 for m in st.session_state.llm_metrics)
+                total_input = sum(m.get("input_tokens") or 0 for m in st.session_state.llm_metrics) + cache_read + cache_write
+                st.caption(f"Prompt cache: {cache_read:,} tokens read, {cache_write:,} tokens written, of {total_input:,} input tokens.")
 
 with chat_tab:
     chat_view.render(ai_service)
\ No newline at end of file
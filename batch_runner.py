@@ -0,0 +1,161 @@
+# batch_runner.py
+
+import os
+import json
+import time
+import argparse
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from services import jira_service, salesforce_service, llm_metrics
+
+# --- CONFIGURATION ---
+DEFAULT_CONCURRENCY = 4
+DEFAULT_OUTPUT_PATH = "batch_results.jsonl"
+COMPLETED_STATUSES = {"ok", "needs_clarification"}     # Skipped when resuming; "failed" is retried
+
+def load_ai_service(provider):
+    if provider == "Claude":
+        from services import claude_service as ai_service
+    else:
+        from services import openai_service as ai_service
+    return ai_service
+
+def load_checkpoint(path):
+    """
+    Ticket ids already completed in an earlier run, read from the output file itself:
+    every result is appended as soon as it's ready, so the output doubles as the checkpoint.
+    """
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue    # A partially written last line from an interrupted run.
+            if record.get("status") in COMPLETED_STATUSES:
+                completed.add(record["ticket_id"])
+    return completed
+
+def build_schema_context(ai_service, user_story):
+    """
+    The wizard's schema lookup, without the UI: semantic retrieval first, else entity
+    extraction. Raises if the schema cache can't be read or has none of the objects.
+    """
+    if salesforce_service.is_semantic_retrieval_enabled():
+        schema_context, _ = salesforce_service.get_schema_context_from_vectors(user_story)
+        if schema_context is not None:
+            return schema_context
+    objects = sorted(set(ai_service.extract_entities_from_story(user_story) + salesforce_service.extract_sfdc_objects_by_keyword(user_story)))
+    if not objects:
+        return "No schema context available."
+    schema_context, debug_data = salesforce_service.get_org_schema_for_objects(objects)
+    # Same rule as the wizard: errors and misses leave "4_Final_Schema_Context" unset or "None".
+    # Raising records the ticket as failed, so it isn't checkpointed and is retried on resume.
+    if debug_data.get("4_Final_Schema_Context") in (None, "None"):
+        raise RuntimeError(f"Schema lookup failed: {schema_context}")
+    return schema_context
+
+def process_ticket(ai_service, ticket_id, user_story):
+    """Runs schema context -> triage -> technical solution for one fetched ticket."""
+    started = time.perf_counter()
+    record = {"ticket_id": ticket_id, "provider": ai_service.PROVIDER}
+    with llm_metrics.usage_scope() as usage:
+        try:
+            if not user_story:
+                raise RuntimeError("Could not fetch the story from Jira.")
+            schema_context = build_schema_context(ai_service, user_story)
+            triage = ai_service.analyze_story(user_story, schema_context)
+            if not triage:
+                raise RuntimeError("Story analysis failed.")
+            record["triage_status"] = triage.get("status")
+            if triage.get("status") == "clear":
+                record["solution_overview"] = triage.get("solution", "")
+                # Raises on any failure, including a stream cut off part-way, so a truncated
+                # solution is recorded as failed and retried on resume.
+                record["technical_solution"] = ai_service.generate_technical_solution(
+                    user_story, record["solution_overview"], schema_context, raise_errors=True)
+                record["status"] = "ok"
+            else:
+                # Clarifying questions need a human; the ticket is done as far as the batch goes.
+                record["clarification_questions"] = triage.get("clarification_questions", [])
+                record["status"] = "needs_clarification"
+        except Exception as e:
+            record["status"], record["error"] = "failed", str(e)
+    record["tokens"] = dict(usage)
+    record["seconds"] = round(time.perf_counter() - started, 2)
+    record["finished_at"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    return record
+
+def run_batch(ticket_ids, provider="Claude", concurrency=DEFAULT_CONCURRENCY, output_path=DEFAULT_OUTPUT_PATH, stories=None):
+    """
+    Processes the tickets on a bounded thread pool, appending one JSON line per ticket to
+    output_path as each finishes. Tickets already completed in output_path are skipped,
+    so an interrupted run resumes where it stopped. stories ({ticket id: story text})
+    can be passed when already fetched; otherwise the pending tickets are fetched in bulk.
+    Returns the throughput summary.
+    """
+    ai_service = load_ai_service(provider)
+    ticket_ids = list(dict.fromkeys(ticket_ids))
+    completed = load_checkpoint(output_path)
+    pending = [t for t in ticket_ids if t not in completed]
+    if stories is None:
+        stories = jira_service.fetch_stories(pending) if pending else {}
+    print(f"🚀 {len(pending)} ticket(s) to process with {provider} ({len(ticket_ids) - len(pending)} already done), concurrency {concurrency}.")
+
+    write_lock = threading.Lock()
+    counts = {"ok": 0, "needs_clarification": 0, "failed": 0}
+    token_totals = {field: 0 for field in llm_metrics.USAGE_FIELDS}
+    started = time.perf_counter()
+    with open(output_path, "a", encoding="utf-8") as output, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {executor.submit(process_ticket, ai_service, ticket_id, stories.get(ticket_id.upper())): ticket_id for ticket_id in pending}
+        for done, future in enumerate(as_completed(futures), start=1):
+            record = future.result()
+            with write_lock:
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+            counts[record["status"]] += 1
+            for field in token_totals:
+                token_totals[field] += record["tokens"][field]
+            icon = "✅" if record["status"] == "ok" else "❓" if record["status"] == "needs_clarification" else "❌"
+            print(f"{icon} [{done}/{len(pending)}] {record['ticket_id']}: {record['status']} in {record['seconds']}s"
+                  + (f" ({record['error']})" if record.get("error") else ""))
+
+    elapsed = time.perf_counter() - started
+    processed = sum(counts.values())
+    total_tokens = sum(token_totals.values())
+    summary = {
+        "processed": processed, **counts,
+        "elapsed_seconds": round(elapsed, 1),
+        "tickets_per_minute": round(processed / elapsed * 60, 2) if elapsed and processed else 0.0,
+        "tokens_per_ticket": round(total_tokens / processed) if processed else 0,
+        "tokens": token_totals
+    }
+    print(f"✅ Batch finished: {processed} ticket(s) in {summary['elapsed_seconds']}s "
+          f"({summary['tickets_per_minute']} tickets/min, {summary['tokens_per_ticket']} tokens/ticket); "
+          f"{counts['ok']} ok, {counts['needs_clarification']} need clarification, {counts['failed']} failed.")
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run triage and technical-solution generation over many Jira tickets without the UI.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--jql", help="JQL query selecting the tickets to process.")
+    source.add_argument("--tickets", nargs="+", metavar="KEY", help="Ticket keys to process, e.g. PROJ-1 PROJ-2.")
+    parser.add_argument("--provider", choices=("Claude", "OpenAI"), default="Claude")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Tickets processed in parallel.")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_PATH, help="JSONL results file; also the checkpoint for resuming.")
+    parser.add_argument("--summary-json", metavar="FILE", help="Also write the throughput summary to this file.")
+    args = parser.parse_args()
+
+    # A JQL run fetches every story in the same paginated search that finds the tickets.
+    stories = jira_service.search_stories(args.jql) if args.jql else None
+    tickets = args.tickets or list(stories)
+    if not tickets:
+        print("ERROR: No tickets to process.")
+        raise SystemExit(1)
+    result = run_batch(tickets, provider=args.provider, concurrency=max(1, args.concurrency), output_path=args.output, stories=stories)
+    if args.summary_json:
+        with open(args.summary_json, "w") as f:
+            json.dump(result, f, indent=2)
@@ -0,0 +1,354 @@
+# benchmarks/fakes.py
+"""
+Deterministic local stand-ins for every external service, with injectable latency:
+a Salesforce org, Redis, and an HTTP server speaking the Anthropic Messages, OpenAI
+Chat Completions and OpenAI Embeddings streaming APIs. The LLM SDKs are pointed at
+the server with ANTHROPIC_BASE_URL / OPENAI_BASE_URL, so the real SDKs, connection
+pool, retries and stream parsing are exercised; only the network is fake.
+"""
+
+import re
+import json
+import time
+import fnmatch
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+from services import tokenizer
+
+STANDARD_OBJECTS = ["Account", "Contact", "Opportunity", "Case", "Lead", "Campaign", "Product2", "Quote", "Order", "Contract"]
+FIELD_TYPES = ["string", "picklist", "double", "date", "datetime", "boolean", "reference", "textarea", "currency", "email"]
+FILLER = "The handler validates the incoming records, groups them by parent and updates the related fields in bulk. "
+
+def filler_text(tokens):
+    """Roughly `tokens` tokens of plausible prose."""
+    chars = tokens * tokenizer.CHARS_PER_TOKEN
+    return (FILLER * (chars // len(FILLER) + 1))[:chars]
+
+# --- Salesforce ---
+class FakeOrg:
+    """A synthetic org: standard objects plus numbered custom objects, Apex classes and Flows."""
+
+    def __init__(self, n_objects, fields_per_object=40, apex_classes=None, flows=None, apex_body_tokens=400):
+        standard = STANDARD_OBJECTS[:min(n_objects, len(STANDARD_OBJECTS))]
+        custom = [f"Custom_Object_{i}__c" for i in range(n_objects - len(standard))]
+        self.object_names = standard + custom
+        self.fields_per_object = fields_per_object
+        self.apex_classes = [f"Service{i}" for i in range(n_objects // 5 if apex_classes is None else apex_classes)]
+        self.flows = [f"Flow_{i}" for i in range(n_objects // 10 if flows is None else flows)]
+        self.apex_body = filler_text(apex_body_tokens)
+
+    def describe(self, name):
+        fields = [{"name": "Id", "type": "id", "createable": False}, {"name": "Name", "type": "string", "createable": True}]
+        for i in range(self.fields_per_object - len(fields)):
+            custom = i % 3 == 0
+            fields.append({
+                "name": f"Field_{i}__c" if custom else f"Field{i}",
+                "type": FIELD_TYPES[i % len(FIELD_TYPES)],
+                "createable": i % 7 != 0
+            })
+        return {"name": name, "label": name.replace("__c", "").replace("_", " "), "fields": fields}
+
+class _FakeResponse:
+    def __init__(self, payload):
+        self._payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._payload
+
+class FakeSalesforce:
+    """
+    The slice of simple_salesforce.Salesforce that cache_builder uses (describe, composite
+    batch describes, query_all and the tooling Flow query), with latency_seconds per call.
+    With modified_since, no Apex class is reported as changed.
+    """
+
+    sf_version = "59.0"
+    sf_instance = "fake.my.salesforce.com"
+    session_id = "offline-benchmark"
+    api_usage = {}
+
+    def __init__(self, org, latency_seconds=0.05):
+        self.org = org
+        self.latency_seconds = latency_seconds
+        self.session = self
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _round_trip(self):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency_seconds)
+
+    def describe(self):
+        self._round_trip()
+        return {"sobjects": [{"name": name, "createable": True} for name in self.org.object_names]}
+
+    def restful(self, path, method="GET", json=None):
+        self._round_trip()
+        results = []
+        for request in json["batchRequests"]:
+            name = request["url"].split("/")[2]
+            results.append({"statusCode": 200, "result": self.org.describe(name)})
+        return {"hasErrors": False, "results": results}
+
+    def query_all(self, query):
+        self._round_trip()
+        if "LastModifiedDate" in query:
+            return {"records": []}
+        if "Body" in query:
+            return {"records": [{"Name": name, "Body": self.org.apex_body} for name in self.org.apex_classes]}
+        return {"records": [{"Name": name} for name in self.org.apex_classes]}
+
+    def get(self, url, headers=None):
+        self._round_trip()
+        return _FakeResponse({"records": [
+            {"DeveloperName": name, "Description": f"Automates {name.replace('_', ' ')}."} for name in self.org.flows
+        ]})
+
+# --- Redis ---
+class FakeRedis:
+    """
+    An in-memory Redis with decode_responses=True semantics for the commands the schema
+    cache uses. Every command, or every executed pipeline, costs one latency_seconds round trip.
+    """
+
+    def __init__(self, latency_seconds=0.0005):
+        self.latency_seconds = latency_seconds
+        self.round_trips = 0
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _round_trip(self):
+        with self._lock:
+            self.round_trips += 1
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+    def ping(self):
+        self._round_trip()
+        return True
+
+    def get(self, key):
+        self._round_trip()
+        return self._data.get(key)
+
+    def mget(self, keys):
+        self._round_trip()
+        return [self._data.get(key) for key in keys]
+
+    def set(self, key, value, ex=None):
+        self._round_trip()
+        self._data[key] = str(value)
+        return True
+
+    def expire(self, key, ttl):
+        self._round_trip()
+        if ttl <= 0:
+            self._data.pop(key, None)
+        return True
+
+    def scan_iter(self, match="*", count=None):
+        self._round_trip()
+        return iter([key for key in list(self._data) if fnmatch.fnmatchcase(key, match)])
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+class _FakePipeline:
+    def __init__(self, redis_client):
+        self._redis = redis_client
+        self._commands = []
+
+    def set(self, key, value, ex=None):
+        self._commands.append(("set", key, value))
+
+    def expire(self, key, ttl):
+        self._commands.append(("expire", key, ttl))
+
+    def execute(self):
+        self._redis._round_trip()
+        for command, key, arg in self._commands:
+            if command == "set":
+                self._redis._data[key] = str(arg)
+            elif arg <= 0:
+                self._redis._data.pop(key, None)
+        results = [True] * len(self._commands)
+        self._commands = []
+        return results
+
+# --- LLM and embeddings ---
+OUTPUT_TOKENS = {
+    "entity_extraction": 40,
+    "triage": 350,
+    "technical_solution": 900,
+    "single_file_code": 700,
+    "generation_order": 60,
+    "chat_summary": 300,
+    "chat": 400,
+}
+GENERATED_FILES = ["AccountService.cls", "AccountTriggerHandler.cls", "AccountTrigger.trigger", "AccountServiceTest.cls"]
+
+def fake_completion(prompt, object_names=()):
+    """(call kind, response text) for a prompt, recognised by the instructions in prompts.py."""
+    if "entity extraction expert" in prompt:
+        words = set(re.findall(r"\b\w+\b", prompt))
+        return "entity_extraction", json.dumps({"objects": [name for name in object_names if name in words][:8] or ["Account"]})
+    if '"status" field' in prompt:
+        return "triage", json.dumps({"status": "clear", "solution": filler_text(OUTPUT_TOKENS["triage"])})
+    if "Technical Architect" in prompt:
+        files = "\n".join(f"File: {name}" for name in GENERATED_FILES)
+        return "technical_solution", f"## Design\n{filler_text(OUTPUT_TOKENS['technical_solution'])}\n\n## Components\n{files}\n"
+    if "Generate the complete source code" in prompt:
+        body = "\n".join(f"        // {line}" for line in re.findall(r".{1,80}", filler_text(OUTPUT_TOKENS["single_file_code"])))
+        return "single_file_code", f"public with sharing class Generated {{\n    public void run() {{\n{body}\n    }}\n}}"
+    if '"generation_order"' in prompt:
+        return "generation_order", json.dumps({"generation_order": re.findall(r"'([^']+)'", prompt)})
+    if "running summary" in prompt:
+        return "chat_summary", filler_text(OUTPUT_TOKENS["chat_summary"])
+    return "chat", filler_text(OUTPUT_TOKENS["chat"])
+
+def fake_embedding(text, dimension):
+    """A unit vector seeded by the text, so equal texts always embed identically."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).normal(size=dimension).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+class FakeLLMServer:
+    """
+    A local HTTP server for /v1/messages (Anthropic), /v1/chat/completions (OpenAI) and
+    /v1/embeddings. Streams start after time_to_first_token seconds and then arrive at
+    tokens_per_second; embeddings take embedding_latency_seconds per request. Each
+    request is served on its own thread, like a provider with no rate limit.
+    """
+
+    def __init__(self, time_to_first_token=0.4, tokens_per_second=80, embedding_latency_seconds=0.15,
+                 embedding_dimension=1536, object_names=(), tokens_per_delta=4):
+        self.time_to_first_token = time_to_first_token
+        self.tokens_per_second = tokens_per_second
+        self.embedding_latency_seconds = embedding_latency_seconds
+        self.embedding_dimension = embedding_dimension
+        self.object_names = list(object_names)
+        self.tokens_per_delta = tokens_per_delta
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-llm-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def count(self, kind):
+        with self._lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+
+    def deltas(self, text):
+        """Splits text into timed deltas: the first after time_to_first_token, then at tokens_per_second."""
+        step = self.tokens_per_delta * tokenizer.CHARS_PER_TOKEN
+        time.sleep(self.time_to_first_token)
+        for i in range(0, len(text), step):
+            if i:
+                time.sleep(self.tokens_per_delta / self.tokens_per_second)
+            yield text[i:i + step]
+
+def _prompt_text(body):
+    parts = [body.get("system") or ""]
+    for message in body.get("messages", []):
+        content = message["content"]
+        parts.append(content if isinstance(content, str) else "".join(block.get("text", "") for block in content))
+    return "\n".join(parts)
+
+def _make_handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"   # Keep-alive, so the app's connection pool is exercised
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            path = self.path.split("?")[0]
+            if path.endswith("/embeddings"):
+                return self._embeddings(body)
+            prompt = _prompt_text(body)
+            kind, text = fake_completion(prompt, server.object_names)
+            server.count(kind)
+            usage = {"input_tokens": tokenizer.count_tokens(prompt), "output_tokens": tokenizer.count_tokens(text)}
+            if path.endswith("/messages"):
+                self._anthropic_stream(body, text, usage)
+            elif path.endswith("/chat/completions"):
+                self._openai_stream(body, text, usage)
+            else:
+                self.send_error(404)
+
+        def _embeddings(self, body):
+            server.count("embeddings")
+            inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            time.sleep(server.embedding_latency_seconds)
+            payload = json.dumps({
+                "object": "list", "model": body.get("model", ""),
+                "data": [{"object": "embedding", "index": i, "embedding": fake_embedding(text, server.embedding_dimension)} for i, text in enumerate(inputs)],
+                "usage": {"prompt_tokens": sum(tokenizer.count_tokens(t) for t in inputs), "total_tokens": sum(tokenizer.count_tokens(t) for t in inputs)}
+            }).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _start_stream(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+        def _chunk(self, data):
+            data = data.encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def _event(self, event, payload):
+            self._chunk(f"event: {event}\ndata: {json.dumps(payload)}\n\n")
+
+        def _anthropic_stream(self, body, text, usage):
+            self._start_stream()
+            self._event("message_start", {"type": "message_start", "message": {
+                "id": "msg_offline", "type": "message", "role": "assistant", "model": body.get("model", ""),
+                "content": [], "stop_reason": None, "stop_sequence": None,
+                "usage": {"input_tokens": usage["input_tokens"], "output_tokens": 1, "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0}
+            }})
+            self._event("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+            for delta in server.deltas(text):
+                self._event("content_block_delta", {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": delta}})
+            self._event("content_block_stop", {"type": "content_block_stop", "index": 0})
+            self._event("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None}, "usage": {"output_tokens": usage["output_tokens"]}})
+            self._event("message_stop", {"type": "message_stop"})
+            self._chunk("")
+
+        def _openai_stream(self, body, text, usage):
+            self._start_stream()
+            chunk = {"id": "chatcmpl-offline", "object": "chat.completion.chunk", "created": 0, "model": body.get("model", "")}
+            for delta in server.deltas(text):
+                self._chunk(f"data: {json.dumps({**chunk, 'choices': [{'index': 0, 'delta': {'content': delta}, 'finish_reason': None}]})}\n\n")
+            self._chunk(f"data: {json.dumps({**chunk, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})}\n\n")
+            self._chunk(f"data: {json.dumps({**chunk, 'choices': [], 'usage': {'prompt_tokens': usage['input_tokens'], 'completion_tokens': usage['output_tokens'], 'total_tokens': usage['input_tokens'] + usage['output_tokens'], 'prompt_tokens_details': {'cached_tokens': 0}}})}\n\n")
+            self._chunk("data: [DONE]\n\n")
+            self._chunk("")
+
+    return Handler
@@ -0,0 +1,84 @@
+# benchmarks/import_time_benchmark.py
+"""
+Measures the cold import time of the app's entry modules with `python -X importtime`
+and checks it against a budget. Also fails if importing a module pulls in one of the
+heavy SDKs, which must only be loaded on first use, or (for the CLIs that don't need
+it) the streamlit UI stack.
+
+    python -m benchmarks.import_time_benchmark --repeat 5
+"""
+
+import re
+import sys
+import json
+import argparse
+import subprocess
+
+# Cumulative import time budget per module, in milliseconds. Most of it is streamlit itself.
+BUDGET_MS = {
+    "services.claude_service": 700,
+    "services.openai_service": 700,
+    "services.salesforce_service": 900,
+    "services.jira_service": 700,
+    "services.jira_outbox": 700,
+    "ui_components.chat_view": 700,
+    "batch_runner": 900,
+    "cache_builder": 300,   # A CLI: no streamlit at all
+}
+LAZY_SDKS = ("anthropic", "openai", "pinecone", "simple_salesforce", "jira", "redis", "httpx")
+# Packages a module must not load on import, on top of LAZY_SDKS.
+FORBIDDEN_PACKAGES = {
+    "cache_builder": ("streamlit", "numpy"),
+}
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+def measure(module):
+    """(cumulative ms, {top-level package: cumulative ms}) for one cold import in a fresh interpreter."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, check=True)
+    total_us, packages = None, {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative_us, name = int(match.group(2)), match.group(4)
+        if name == module:
+            total_us = cumulative_us
+        package = name.split(".")[0]
+        packages[package] = max(packages.get(package, 0), cumulative_us)
+    return total_us / 1000, {name: us / 1000 for name, us in packages.items()}
+
+def run(modules, repeat, budget_scale=1.0):
+    results = {}
+    for module in modules:
+        runs = [measure(module) for _ in range(repeat)]
+        # The fastest run is the least disturbed by the rest of the machine.
+        total_ms, packages = min(runs, key=lambda r: r[0])
+        budget_ms = BUDGET_MS[module] * budget_scale
+        results[module] = {
+            "import_ms": round(total_ms, 1),
+            "budget_ms": round(budget_ms, 1),
+            "lazy_sdks_loaded": sorted(sdk for sdk in LAZY_SDKS + FORBIDDEN_PACKAGES.get(module, ()) if sdk in packages),
+            "slowest_packages_ms": dict(sorted(((name, round(ms, 1)) for name, ms in packages.items()), key=lambda p: -p[1])[:5]),
+        }
+        results[module]["ok"] = total_ms <= budget_ms and not results[module]["lazy_sdks_loaded"]
+    return {"python": sys.version.split()[0], "repeat": repeat, "modules": results, "ok": all(r["ok"] for r in results.values())}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="+", default=list(BUDGET_MS), choices=list(BUDGET_MS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--budget-scale", type=float, default=1.0, help="Multiplies every budget, e.g. 2.0 on a slow CI runner.")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results only.")
+    args = parser.parse_args()
+
+    results = run(args.modules, max(1, args.repeat), args.budget_scale)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"Cold import time, best of {results['repeat']} (Python {results['python']})")
+        for module, r in results["modules"].items():
+            icon = "✅" if r["ok"] else "❌"
+            loaded = f"  loads {', '.join(r['lazy_sdks_loaded'])} eagerly" if r["lazy_sdks_loaded"] else ""
+            print(f"  {icon} {module:<28} {r['import_ms']:>7.1f} ms  (budget {r['budget_ms']:.0f} ms){loaded}")
+    raise SystemExit(0 if results["ok"] else 1)
@@ -0,0 +1,287 @@
+# benchmarks/offline_benchmark.py
+"""
+End-to-end performance benchmarks that need no Salesforce, Redis, Jira, Pinecone or
+LLM account: every external service is replaced by a deterministic local stand-in from
+benchmarks/fakes.py with configurable latency. Scenarios:
+
+    pipeline  cache_builder.run_indexing_pipeline throughput (full and incremental)
+    schema    get_org_schema_for_objects latency against orgs of 100 to 5,000 objects
+    wizard    latency of each wizard stage, from entity extraction to code generation
+    load      several users running the wizard at once
+
+    python -m benchmarks.offline_benchmark --scenarios schema wizard --output results.json
+"""
+
+import io
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+SCENARIOS = ["pipeline", "schema", "wizard", "load"]
+OFFLINE_API_KEY = "offline-benchmark"
+STORY = ("As a sales manager, I want every Opportunity that moves to Closed Won to update the related Account's "
+         "lifetime value and create a follow-up Case for onboarding, so that the Contact owning the Account is contacted within a week.")
+
+def configure_offline_environment(workdir, server):
+    """
+    Points the app at the fakes: a secrets file with placeholder API keys, the SDKs'
+    base URLs at the fake LLM server, and the local vector index instead of Pinecone.
+    Must run before anything reads st.secrets or builds an SDK client.
+    """
+    from streamlit import config
+    from streamlit.logger import set_log_level
+    secrets_path = os.path.join(workdir, "secrets.toml")
+    with open(secrets_path, "w") as f:
+        f.write(f'ANTHROPIC_API_KEY = "{OFFLINE_API_KEY}"\nOPENAI_API_KEY = "{OFFLINE_API_KEY}"\nSCHEMA_RETRIEVAL = "keyword"\n')
+    config.set_option("secrets.files", [secrets_path])
+    set_log_level("error")   # st.* calls outside a script run only log; keep the output readable
+    os.environ.update({
+        "ANTHROPIC_BASE_URL": server.url,
+        "OPENAI_BASE_URL": f"{server.url}/v1",
+        "OPENAI_API_KEY": OFFLINE_API_KEY,
+        "VECTOR_STORE": "local",
+    })
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    return {
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+def clear_schema_caches():
+    """Drops the in-process schema caches so the next lookup is served from (fake) Redis."""
+    from services import salesforce_service
+    with salesforce_service._schema_cache_lock:
+        salesforce_service._schema_version_cache.clear()
+        salesforce_service._object_matcher_cache.clear()
+        salesforce_service._object_fields_cache.clear()
+
+def populate_schema_cache(redis_client, org):
+    """Writes org's schema the way cache_builder does, so the app reads the same layout."""
+    from cache_builder import RedisSchemaWriter
+    writer = RedisSchemaWriter(redis_client)
+    for name in org.object_names:
+        description = org.describe(name)
+        writer.add(name, [{"name": f["name"], "type": f["type"], "createable": f["createable"]} for f in description["fields"]], description["label"])
+    writer.publish()
+
+# --- Scenarios ---
+def run_pipeline(args, workdir):
+    import cache_builder
+    from benchmarks.fakes import FakeOrg, FakeSalesforce, FakeRedis
+    import openai   # Imported lazily by the pipeline; loaded here so the first org size isn't charged for it.
+    results = {}
+    for n_objects in args.org_sizes:
+        org = FakeOrg(n_objects)
+        sf, redis_client = FakeSalesforce(org, latency_seconds=args.sf_latency_ms / 1000), FakeRedis(latency_seconds=args.redis_latency_ms / 1000)
+        os.environ["LOCAL_INDEX_PATH"] = os.path.join(workdir, f"index_{n_objects}")
+        runs = {}
+        for mode, incremental in (("full", False), ("incremental", True)):
+            calls_before = sf.calls
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                stats = cache_builder.run_indexing_pipeline(incremental=incremental, sf_client=sf, redis_client=redis_client)
+            elapsed = time.perf_counter() - started
+            if stats is None:
+                raise RuntimeError(f"Indexing pipeline failed to start for {n_objects} objects.")
+            runs[mode] = {
+                "seconds": round(elapsed, 2),
+                "documents": stats["documents"],
+                "embedded": stats["embedded"],
+                "embedding_requests": stats["requests"],
+                "documents_per_second": round(stats["documents"] / elapsed, 1) if stats["documents"] else 0.0,
+                "salesforce_calls": sf.calls - calls_before,
+            }
+        results[str(n_objects)] = {"objects": n_objects, "apex_classes": len(org.apex_classes), "flows": len(org.flows), **runs}
+    return results
+
+def run_schema(args):
+    from services import salesforce_service
+    from benchmarks.fakes import FakeOrg, FakeRedis
+    rng = random.Random(7)
+    results = {}
+    for n_objects in args.schema_object_counts:
+        org = FakeOrg(n_objects)
+        redis_client = FakeRedis(latency_seconds=args.redis_latency_ms / 1000)
+        populate_schema_cache(redis_client, org)
+        # A typical story names a few standard objects and a couple of custom ones.
+        terms = org.object_names[:3] + rng.sample(org.object_names[3:], min(3, len(org.object_names) - 3))
+        cold, warm = [], []
+        round_trips_before = redis_client.round_trips
+        for _ in range(args.repeat):
+            clear_schema_caches()
+            started = time.perf_counter()
+            salesforce_service.get_org_schema_for_objects(terms, redis_client=redis_client)
+            cold.append(time.perf_counter() - started)
+        cold_round_trips = (redis_client.round_trips - round_trips_before) / args.repeat
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            schema_context, _ = salesforce_service.get_org_schema_for_objects(terms, redis_client=redis_client)
+            warm.append(time.perf_counter() - started)
+        results[str(n_objects)] = {
+            "objects": n_objects,
+            "cold": {**percentiles(cold), "redis_round_trips": cold_round_trips},
+            "warm": percentiles(warm),
+            "schema_context_chars": len(schema_context),
+        }
+    return results
+
+def run_wizard_flow(ai_service, redis_client, user_story):
+    """One pass through the wizard as app.py drives it, without the UI. Returns {stage: seconds}."""
+    from services import salesforce_service, dependency_analyzer, codegen_scheduler
+    timings = {}
+
+    def timed(stage, func, *func_args):
+        started = time.perf_counter()
+        result = func(*func_args)
+        timings[stage] = round(time.perf_counter() - started, 3)
+        return result
+
+    objects = timed("entity_extraction", lambda: sorted(set(
+        ai_service.extract_entities_from_story(user_story) + salesforce_service.extract_sfdc_objects_by_keyword(user_story))))
+    schema_context, _ = timed("schema_context", salesforce_service.get_org_schema_for_objects, objects, redis_client)
+    triage = timed("triage", ai_service.analyze_story, user_story, schema_context)
+    if not triage or triage.get("status") != "clear":
+        raise RuntimeError(f"Unexpected triage result: {triage}")
+    technical_solution = timed("technical_solution", ai_service.generate_technical_solution, user_story, triage["solution"], schema_context)
+
+    def generate_code():
+        filenames = re.findall(r'(\w+\.(?:cls|trigger|js|html|css)(?:-meta\.xml)?|\w+\.xml)\b', technical_solution)
+        order, dependencies, _ = dependency_analyzer.generation_order(filenames)
+        full_context = f"USER STORY:\n{user_story}\n\nSOLUTION OVERVIEW:\n{triage['solution']}\n\nTECHNICAL SOLUTION:\n{technical_solution}"
+        files = list(codegen_scheduler.generate_files(
+            lambda name, dependency_code: ai_service.generate_single_file_code(full_context, name, dependency_code),
+            order, dependencies, ai_service.MAX_CONCURRENT_REQUESTS))
+        if not files or any(error for _, _, error in files):
+            raise RuntimeError("Code generation failed.")
+        return files
+
+    timings["files_generated"] = len(timed("code_generation", generate_code))
+    timings["total"] = round(sum(v for k, v in timings.items() if k != "files_generated"), 3)
+    return timings
+
+def _wizard_setup(args):
+    from batch_runner import load_ai_service
+    from services import llm_gateway
+    from benchmarks.fakes import FakeOrg, FakeRedis
+    org = FakeOrg(args.wizard_org_size)
+    redis_client = FakeRedis(latency_seconds=args.redis_latency_ms / 1000)
+    populate_schema_cache(redis_client, org)
+    ai_service = load_ai_service(args.provider)
+    # Build the SDK client up front, so the first timed call isn't charged for it.
+    llm_gateway.get_adapter(ai_service.PROVIDER)
+    return ai_service, redis_client
+
+def run_wizard(args):
+    ai_service, redis_client = _wizard_setup(args)
+    # Every run gets a distinct story, so no prompt is answered from the LLM response cache.
+    flows = [run_wizard_flow(ai_service, redis_client, f"{STORY} (Wizard run {i}.)") for i in range(args.repeat)]
+    stages = [stage for stage in flows[0] if stage != "files_generated"]
+    return {
+        "provider": args.provider,
+        "runs": len(flows),
+        "files_generated": flows[0]["files_generated"],
+        "stages": {stage: percentiles([flow[stage] for flow in flows]) for stage in stages},
+    }
+
+def run_load(args):
+    ai_service, redis_client = _wizard_setup(args)
+
+    def user_session(user):
+        return [run_wizard_flow(ai_service, redis_client, f"{STORY} (User {user}, run {i}.)") for i in range(args.flows_per_user)]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as executor:
+        flows = [flow for session in executor.map(user_session, range(args.users)) for flow in session]
+    elapsed = time.perf_counter() - started
+    return {
+        "provider": args.provider,
+        "users": args.users,
+        "flows": len(flows),
+        "elapsed_seconds": round(elapsed, 2),
+        "flows_per_minute": round(len(flows) / elapsed * 60, 2),
+        "flow_latency": percentiles([flow["total"] for flow in flows]),
+        "stages": {stage: percentiles([flow[stage] for flow in flows]) for stage in flows[0] if stage not in ("files_generated", "total")},
+    }
+
+def run(args):
+    from benchmarks.fakes import FakeLLMServer, FakeOrg
+    results = {
+        "python": sys.version.split()[0],
+        "config": {k: v for k, v in vars(args).items() if k not in ("json", "output")},
+        "scenarios": {},
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        server = FakeLLMServer(
+            time_to_first_token=args.ttft_ms / 1000, tokens_per_second=args.tokens_per_second,
+            embedding_latency_seconds=args.embedding_latency_ms / 1000,
+            object_names=FakeOrg(args.wizard_org_size).object_names
+        ).start()
+        try:
+            configure_offline_environment(workdir, server)
+            for scenario in args.scenarios:
+                started = time.perf_counter()
+                if scenario == "pipeline": results["scenarios"]["pipeline"] = run_pipeline(args, workdir)
+                elif scenario == "schema": results["scenarios"]["schema"] = run_schema(args)
+                elif scenario == "wizard": results["scenarios"]["wizard"] = run_wizard(args)
+                elif scenario == "load": results["scenarios"]["load"] = run_load(args)
+                if not args.json:
+                    print(f"✅ {scenario} finished in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+        finally:
+            server.stop()
+        results["fake_llm_requests"] = dict(server.requests)
+    return results
+
+def print_summary(results):
+    scenarios = results["scenarios"]
+    for n, r in scenarios.get("pipeline", {}).items():
+        print(f"pipeline  {n:>5} objects: full {r['full']['seconds']:>6.2f}s ({r['full']['documents_per_second']} docs/s, "
+              f"{r['full']['embedding_requests']} embedding requests), incremental {r['incremental']['seconds']:.2f}s")
+    for n, r in scenarios.get("schema", {}).items():
+        print(f"schema    {n:>5} objects: cold p50 {r['cold']['p50_ms']:.2f} ms / p95 {r['cold']['p95_ms']:.2f} ms, "
+              f"warm p50 {r['warm']['p50_ms']:.2f} ms / p95 {r['warm']['p95_ms']:.2f} ms")
+    if "wizard" in scenarios:
+        for stage, p in scenarios["wizard"]["stages"].items():
+            print(f"wizard    {stage:<18} p50 {p['p50_ms']:>9.1f} ms  p95 {p['p95_ms']:>9.1f} ms")
+    if "load" in scenarios:
+        r = scenarios["load"]
+        print(f"load      {r['users']} users, {r['flows']} flows in {r['elapsed_seconds']}s: {r['flows_per_minute']} flows/min, "
+              f"flow p50 {r['flow_latency']['p50_ms'] / 1000:.1f}s / p95 {r['flow_latency']['p95_ms'] / 1000:.1f}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--provider", choices=("Claude", "OpenAI"), default="Claude")
+    parser.add_argument("--org-sizes", nargs="+", type=int, default=[100, 500], help="SObjects per org for the pipeline scenario.")
+    parser.add_argument("--schema-object-counts", nargs="+", type=int, default=[100, 500, 1000, 5000])
+    parser.add_argument("--wizard-org-size", type=int, default=500, help="SObjects in the schema cache for the wizard and load scenarios.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement in the schema and wizard scenarios.")
+    parser.add_argument("--users", type=int, default=4, help="Concurrent users in the load scenario.")
+    parser.add_argument("--flows-per-user", type=int, default=1)
+    parser.add_argument("--sf-latency-ms", type=float, default=80)
+    parser.add_argument("--redis-latency-ms", type=float, default=1)
+    parser.add_argument("--embedding-latency-ms", type=float, default=150)
+    parser.add_argument("--ttft-ms", type=float, default=400, help="Fake LLM time to first token.")
+    parser.add_argument("--tokens-per-second", type=float, default=150, help="Fake LLM output rate.")
+    parser.add_argument("--output", metavar="FILE", help="Also write the machine-readable results to this file.")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results only.")
+    args = parser.parse_args()
+    args.repeat, args.users, args.flows_per_user = max(1, args.repeat), max(1, args.users), max(1, args.flows_per_user)
+
+    results = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_summary(results)
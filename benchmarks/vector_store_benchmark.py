@@ -0,0 +1,92 @@
+# benchmarks/vector_store_benchmark.py
+"""
+Compares recall and latency of the LocalVectorIndex variants on synthetic,
+clustered embeddings shaped like the salesforce-knowledge index.
+
+    python -m benchmarks.vector_store_benchmark --vectors 5000 --queries 200
+"""
+
+import argparse
+import json
+import tempfile
+import time
+import numpy as np
+from services.cache_common import VECTOR_DIMENSION
+from services.local_vector_index import LocalVectorIndex
+
+METADATA_TYPES = ["SObject", "ApexClass", "Flow"]
+
+def make_corpus(n_vectors, n_queries, dimension, seed=7):
+    """Clustered vectors (documents about the same object land near each other) plus noisy queries."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, n_vectors // 20), dimension)).astype(np.float32)
+    assignments = rng.integers(0, len(centers), size=n_vectors)
+    vectors = centers[assignments] + 0.5 * rng.normal(size=(n_vectors, dimension)).astype(np.float32)
+    queries = centers[rng.integers(0, len(centers), size=n_queries)] + 0.7 * rng.normal(size=(n_queries, dimension)).astype(np.float32)
+    return vectors, queries
+
+def build_index(path, vectors, quantize):
+    index = LocalVectorIndex(path, dimension=vectors.shape[1], quantize=quantize)
+    index.upsert(vectors=[
+        {"id": f"doc:{i}", "values": vector, "metadata": {"type": METADATA_TYPES[i % len(METADATA_TYPES)], "name": f"doc{i}"}}
+        for i, vector in enumerate(vectors)
+    ])
+    index.save()
+    # Re-open from disk so queries run against the memory-mapped matrix, as in the app.
+    return LocalVectorIndex(path)
+
+def exact_top_k(vectors, queries, k, rows=None):
+    """Brute-force float64 ground truth, optionally restricted to a subset of rows."""
+    rows = np.arange(len(vectors)) if rows is None else rows
+    normed = vectors[rows] / np.linalg.norm(vectors[rows], axis=1, keepdims=True)
+    q = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    return [set(f"doc:{rows[i]}" for i in np.argsort(-row)[:k]) for row in q.astype(np.float64) @ normed.T]
+
+def measure(index, queries, truth, k, metadata_filter=None):
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        response = index.query(vector=query, top_k=k, filter=metadata_filter)
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += len(expected & {match["id"] for match in response["matches"]})
+
+    started = time.perf_counter()
+    index.query_batch(queries, top_k=k, filter=metadata_filter)
+    batch_ms = (time.perf_counter() - started) * 1000
+
+    latencies.sort()
+    return {
+        "recall_at_k": round(hits / (len(queries) * k), 4),
+        "p50_ms": round(latencies[len(latencies) // 2], 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95)], 3),
+        "batched_ms_per_query": round(batch_ms / len(queries), 3)
+    }
+
+def run(n_vectors, n_queries, k, dimension):
+    vectors, queries = make_corpus(n_vectors, n_queries, dimension)
+    truth = exact_top_k(vectors, queries, k)
+    sobject_truth = exact_top_k(vectors, queries, k, rows=np.arange(0, len(vectors), len(METADATA_TYPES)))
+    results = {"vectors": n_vectors, "queries": n_queries, "k": k, "dimension": dimension, "variants": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, quantize in (("float32", False), ("int8", True)):
+            index = build_index(f"{tmp}/{name}", vectors, quantize)
+            results["variants"][name] = measure(index, queries, truth, k)
+            results["variants"][f"{name}_filtered"] = measure(index, queries, sobject_truth, k, {"type": {"$eq": "SObject"}})
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--dimension", type=int, default=VECTOR_DIMENSION)
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results only.")
+    args = parser.parse_args()
+
+    results = run(args.vectors, args.queries, args.k, args.dimension)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"LocalVectorIndex: {args.vectors} vectors x {args.dimension} dims, {args.queries} queries, top-{args.k}")
+        for name, r in results["variants"].items():
+            print(f"  {name:<17} recall@k {r['recall_at_k']:.3f}  p50 {r['p50_ms']:.3f} ms  p95 {r['p95_ms']:.3f} ms  batched {r['batched_ms_per_query']:.3f} ms/query")
@@ -2,149 +2,565 @@
 
 import os
 import json
+import asyncio
+import argparse
+import hashlib
+import random
+import time
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
 from dotenv import load_dotenv
-import streamlit as st
-from pinecone import Pinecone, ServerlessSpec
-from openai import OpenAI
-from services import salesforce_service
+from services import tokenizer
+from services.cache_common import (
+    SCHEMA_VERSION_KEY, ALL_OBJECT_NAMES_KEY, OBJECT_LABELS_KEY, schema_key,
+    PINECONE_INDEX_NAME, EMBEDDING_MODEL, VECTOR_DIMENSION, DEFAULT_LOCAL_INDEX_PATH,
+    is_local_store_configured, connect_to_salesforce
+)
+from services.embedding_cache import EmbeddingCache, DEFAULT_CACHE_PATH, DEFAULT_MAX_BYTES
 from urllib.parse import quote_plus
 
 # --- CONFIGURATION ---
-PINECONE_INDEX_NAME = "salesforce-knowledge"
-EMBEDDING_MODEL = "text-embedding-3-small"
-VECTOR_DIMENSION = 1536 
+# PINECONE_INDEX_NAME, EMBEDDING_MODEL and VECTOR_DIMENSION live in services/cache_common.py,
+# which the app's services/vector_store.py also uses to query the same index.
+REDIS_PIPELINE_CHUNK = 200      # SET commands per Redis pipeline round trip
+REDIS_OLD_VERSION_TTL = 3600    # Seconds a replaced schema keyspace stays readable for in-flight requests
+INDEX_MANIFEST_PATH = os.getenv("INDEX_MANIFEST_PATH", f".index_manifest.{PINECONE_INDEX_NAME}.json")
 
-def get_metadata_documents(sf):
+# --- CRAWLER CONFIGURATION ---
+DESCRIBE_BATCH_SIZE = 25        # Composite batch API accepts up to 25 subrequests per call
+CRAWLER_MAX_WORKERS = 8         # Concurrent Salesforce requests in flight per org
+CRAWLER_MAX_RETRIES = 4
+CRAWLER_BACKOFF_SECONDS = 1.0
+API_USAGE_CEILING = 0.9         # Stop describing once this share of the org's daily API limit is used
+
+# --- EMBEDDING CONFIGURATION ---
+EMBEDDING_BATCH_SIZE = 100              # Inputs per embeddings request (also the Pinecone upsert size)
+EMBEDDING_BATCH_TOKEN_BUDGET = 200_000  # OpenAI rejects requests over 300k tokens in total
+EMBEDDING_CONCURRENCY = 4               # Embedding/upsert batches in flight at once
+
+class ApiLimitReached(Exception):
+    """Raised when the org is too close to its daily API request limit to keep crawling."""
+
+def _check_api_usage(sf):
     """
-    Generator function that fetches all metadata from Salesforce
-    and yields it as structured text documents.
+    Uses the Sforce-Limit-Info usage that simple_salesforce records on every call
+    to avoid burning through the rest of the org's daily API allowance.
     """
-    print("\n--- Fetching Metadata from Salesforce ---")
-    
-    # 1. SObjects
-    print("Fetching SObjects...")
-    all_sobjects = sf.describe()['sobjects']
-    object_names = [s['name'] for s in all_sobjects if s['createable']]
-    for name in object_names:
+    usage = getattr(sf, "api_usage", {}).get("api-usage")
+    if usage and usage.total and usage.used / usage.total >= API_USAGE_CEILING:
+        raise ApiLimitReached(f"API usage at {usage.used}/{usage.total} requests for this org.")
+
+def _with_retries(label, func, *args, **kwargs):
+    """
+    Calls func, retrying transient Salesforce/network failures with exponential backoff.
+    """
+    from simple_salesforce import SalesforceGeneralError
+    for attempt in range(CRAWLER_MAX_RETRIES + 1):
         try:
-            desc = getattr(sf, name).describe()
-            fields = [f"- {f['name']} ({f['type']})" for f in desc['fields']]
-            yield {
-                "id": f"sobject:{name}",
-                "text": f"Salesforce Object Schema for {name}.\nFields:\n" + "\n".join(fields),
-                "metadata": {"type": "SObject", "name": name}
-            }
-        except Exception:
-            continue
-    
-    # 2. Apex Classes
-    print("Fetching Apex Classes...")
-    classes = sf.query_all("SELECT Name, Body FROM ApexClass WHERE NamespacePrefix = ''")
-    for cls in classes['records']:
-        yield {
+            return func(*args, **kwargs)
+        except (SalesforceGeneralError, requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt == CRAWLER_MAX_RETRIES:
+                raise
+            delay = CRAWLER_BACKOFF_SECONDS * (2 ** attempt) + random.uniform(0, CRAWLER_BACKOFF_SECONDS)
+            print(f"  - ⏳ {label} failed ({e.__class__.__name__}), retrying in {delay:.1f}s...")
+            time.sleep(delay)
+
+def _sobject_document(name, desc):
+    fields = [f"- {f['name']} ({f['type']})" for f in desc['fields']]
+    return {
+        "id": f"sobject:{name}",
+        "text": f"Salesforce Object Schema for {name}.\nFields:\n" + "\n".join(fields),
+        "metadata": {"type": "SObject", "name": name},
+        # Not embedded; consumed by the Redis schema cache writer.
+        "label": desc.get('label'),
+        "fields": [{"name": f['name'], "type": f['type'], "createable": f['createable']} for f in desc['fields']]
+    }
+
+def _describe_sobject_batch(sf, names):
+    """
+    Describes up to DESCRIBE_BATCH_SIZE SObjects in a single composite batch round trip.
+    Objects whose subrequest fails are skipped, matching the old one-by-one behaviour.
+    """
+    _check_api_usage(sf)
+    batch_requests = [{"method": "GET", "url": f"v{sf.sf_version}/sobjects/{name}/describe"} for name in names]
+    response = _with_retries(
+        f"Describe batch starting at {names[0]}",
+        sf.restful, "composite/batch", method="POST", json={"batchRequests": batch_requests}
+    )
+    documents = []
+    for name, result in zip(names, response['results']):
+        if result.get('statusCode') == 200:
+            documents.append(_sobject_document(name, result['result']))
+    return documents, [f"sobject:{name}" for name in names]
+
+def _fetch_apex_documents(sf, modified_since=None):
+    """
+    Fetches Apex class bodies. With modified_since, only classes changed after that
+    timestamp are downloaded; the names of all classes are still listed so that
+    deleted classes can be detected.
+    """
+    apex_query = "SELECT Name, Body FROM ApexClass WHERE NamespacePrefix = ''"
+    if modified_since:
+        names = _with_retries("Apex class list", sf.query_all, "SELECT Name FROM ApexClass WHERE NamespacePrefix = ''")
+        ids = [f"apexclass:{cls['Name']}" for cls in names['records']]
+        apex_query += f" AND LastModifiedDate > {modified_since}"
+    classes = _with_retries("Apex class query", sf.query_all, apex_query)
+    documents = [
+        {
             "id": f"apexclass:{cls['Name']}",
             "text": f"Apex Class named {cls['Name']}.\nCode Body:\n{cls['Body']}",
             "metadata": {"type": "ApexClass", "name": cls['Name']}
         }
+        for cls in classes['records']
+    ]
+    return documents, ids if modified_since else [doc["id"] for doc in documents]
 
-    # 3. Flows
+def _fetch_flow_documents(sf):
     # MODIFIED: Use the direct API call method to avoid library version issues.
-    print("Fetching Flows...")
-    try:
-        base_url = sf.sf_instance
-        headers = {'Authorization': f"Bearer {sf.session_id}"}
-        api_version = sf.sf_version
-        flow_query = "SELECT DeveloperName, ActiveVersion.VersionNumber, Description FROM FlowDefinition"
-        encoded_query = quote_plus(flow_query)
-        url = f"https://{base_url}/services/data/v{api_version}/tooling/query/?q={encoded_query}"
-        
+    base_url = sf.sf_instance
+    headers = {'Authorization': f"Bearer {sf.session_id}"}
+    api_version = sf.sf_version
+    flow_query = "SELECT DeveloperName, ActiveVersion.VersionNumber, Description FROM FlowDefinition"
+    encoded_query = quote_plus(flow_query)
+    url = f"https://{base_url}/services/data/v{api_version}/tooling/query/?q={encoded_query}"
+
+    def _get_flows():
         response = sf.session.get(url, headers=headers)
         response.raise_for_status()
-        flows = response.json()
-
-        for flow in flows['records']:
-            yield {
-                "id": f"flow:{flow['DeveloperName']}",
-                "text": f"Salesforce Flow named {flow['DeveloperName']}. Description: {flow.get('Description', 'N/A')}",
-                "metadata": {"type": "Flow", "name": flow['DeveloperName']}
-            }
+        return response.json()
+
+    flows = _with_retries("Flow tooling query", _get_flows)
+    documents = [
+        {
+            "id": f"flow:{flow['DeveloperName']}",
+            "text": f"Salesforce Flow named {flow['DeveloperName']}. Description: {flow.get('Description', 'N/A')}",
+            "metadata": {"type": "Flow", "name": flow['DeveloperName']}
+        }
+        for flow in flows['records']
+    ]
+    return documents, [doc["id"] for doc in documents]
+
+def get_metadata_documents(sf, modified_since=None, seen_ids=None):
+    """
+    Generator function that fetches all metadata from Salesforce
+    and yields it as structured text documents.
+
+    SObject describes are sent as composite batches across a bounded worker pool,
+    and the Apex class and Flow queries run alongside them. Documents are yielded
+    as soon as each unit of work completes.
+
+    If seen_ids is given, the id of every piece of metadata that still exists in
+    the org is added to it, including Apex classes skipped by modified_since.
+    When a whole category cannot be fetched, its wildcard id (e.g. "flow:*")
+    is added instead so that callers don't mistake it for deleted metadata.
+    """
+    seen_ids = set() if seen_ids is None else seen_ids
+    print("\n--- Fetching Metadata from Salesforce ---")
+    started_at = time.monotonic()
+
+    print("Fetching SObjects...")
+    all_sobjects = _with_retries("Global describe", sf.describe)['sobjects']
+    object_names = [s['name'] for s in all_sobjects if s['createable']]
+    batches = [object_names[i:i + DESCRIBE_BATCH_SIZE] for i in range(0, len(object_names), DESCRIBE_BATCH_SIZE)]
+    print(f"Describing {len(object_names)} SObjects in {len(batches)} batches with {CRAWLER_MAX_WORKERS} workers...")
+
+    with ThreadPoolExecutor(max_workers=CRAWLER_MAX_WORKERS) as executor:
+        # The Apex and Flow queries are the slowest single requests, so they are queued
+        # first and overlap with the describe batches instead of waiting behind them.
+        print("Fetching Apex Classes...")
+        futures = {executor.submit(_fetch_apex_documents, sf, modified_since): "Apex Classes"}
+        print("Fetching Flows...")
+        futures[executor.submit(_fetch_flow_documents, sf)] = "Flows"
+        futures.update({executor.submit(_describe_sobject_batch, sf, batch): "SObjects" for batch in batches})
+        seen_ids.update(f"sobject:{name}" for name in object_names)
+
+        described, limit_reached = 0, False
+        for future in as_completed(futures):
+            kind = futures[future]
+            try:
+                documents, ids = future.result()
+            except ApiLimitReached as e:
+                if not limit_reached:
+                    print(f"  - ⚠️ WARNING: Skipping remaining {kind}. Reason: {e}")
+                limit_reached = True
+                continue
+            except Exception as e:
+                print(f"  - ⚠️ WARNING: Could not fetch {kind}. Reason: {e}")
+                if kind != "SObjects":
+                    seen_ids.add({"Apex Classes": "apexclass:*", "Flows": "flow:*"}[kind])
+                continue
+
+            seen_ids.update(ids)
+            if kind == "SObjects":
+                described += len(documents)
+                elapsed = time.monotonic() - started_at
+                print(f"  - Described {described}/{len(object_names)} SObjects ({described / elapsed:.1f} objects/sec)")
+            yield from documents
+
+    elapsed = time.monotonic() - started_at
+    print(f"✅ Metadata crawl finished in {elapsed:.1f}s ({described / elapsed if elapsed else 0:.1f} SObjects/sec).")
+
+def _token_budgeted_batches(documents):
+    """
+    Groups documents into batches of at most EMBEDDING_BATCH_SIZE inputs
+    whose estimated token total stays under EMBEDDING_BATCH_TOKEN_BUDGET.
+    """
+    batch, batch_tokens = [], 0
+    for doc in documents:
+        tokens = tokenizer.count_tokens(doc["text"])
+        if batch and (len(batch) >= EMBEDDING_BATCH_SIZE or batch_tokens + tokens > EMBEDDING_BATCH_TOKEN_BUDGET):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(doc)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+async def _embed_batch(openai_client, batch, stats):
+    """
+    Embeds a whole batch in one request. If the batch is rejected (e.g. one
+    oversized Apex body), its documents are retried one by one so that only
+    the offending documents are reported and dropped.
+    """
+    try:
+        stats["requests"] += 1
+        response = await openai_client.embeddings.create(input=[doc["text"] for doc in batch], model=EMBEDDING_MODEL)
+        return [(batch[item.index], item.embedding) for item in response.data]
+    except Exception as e:
+        if len(batch) == 1:
+            print(f"  - ⚠️ WARNING: Could not process document {batch[0]['id']}. Reason: {e}")
+            return []
+        print(f"  - ⚠️ WARNING: Embedding request for {len(batch)} documents failed, retrying individually. Reason: {e}")
+
+    embedded = []
+    for doc in batch:
+        embedded.extend(await _embed_batch(openai_client, [doc], stats))
+    return embedded
+
+async def _embed_and_upsert_batch(openai_client, index, batch, stats, embedding_cache=None):
+    if embedding_cache:
+        cached = embedding_cache.get_many(EMBEDDING_MODEL, [doc["text"] for doc in batch])
+        embedded = [(doc, embedding) for doc, embedding in zip(batch, cached) if embedding is not None]
+        misses = [doc for doc, embedding in zip(batch, cached) if embedding is None]
+        if misses:
+            fresh = await _embed_batch(openai_client, misses, stats)
+            embedding_cache.put_many(EMBEDDING_MODEL, [(doc["text"], embedding) for doc, embedding in fresh])
+            embedded.extend(fresh)
+    else:
+        embedded = await _embed_batch(openai_client, batch, stats)
+    vectors = [{"id": doc["id"], "values": embedding, "metadata": doc["metadata"]} for doc, embedding in embedded]
+    if not vectors:
+        return
+    try:
+        print(f"Upserting batch of {len(vectors)} vectors...")
+        await asyncio.to_thread(index.upsert, vectors=vectors)
+        stats["embedded"] += len(vectors)
+        stats["written_ids"].update(vector["id"] for vector in vectors)
     except Exception as e:
-        print(f"  - ⚠️ WARNING: Could not fetch Flows. Reason: {e}")
+        for vector in vectors:
+            print(f"  - ⚠️ WARNING: Could not process document {vector['id']}. Reason: {e}")
+
+async def embed_and_upsert_documents(documents, openai_client, index, embedding_cache=None):
+    """
+    Embedding stage of the pipeline. Pulls documents from the (blocking) crawler,
+    embeds them in token-budgeted batches and upserts each batch as soon as it is
+    embedded, keeping up to EMBEDDING_CONCURRENCY batches in flight so that
+    crawling, embedding and upserting overlap.
+    """
+    stats = {"documents": 0, "embedded": 0, "requests": 0, "written_ids": set()}
+    semaphore = asyncio.Semaphore(EMBEDDING_CONCURRENCY)
+    tasks = set()
+    batches = _token_budgeted_batches(documents)
+
+    while True:
+        batch = await asyncio.to_thread(next, batches, None)
+        if batch is None:
+            break
+        stats["documents"] += len(batch)
+        await semaphore.acquire()
+        task = asyncio.create_task(_embed_and_upsert_batch(openai_client, index, batch, stats, embedding_cache))
+        task.add_done_callback(lambda _: semaphore.release())
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        await asyncio.gather(*tasks)
+    await openai_client.close()
+    return stats
+
+class RedisSchemaWriter:
+    """
+    Writes the Redis schema cache that salesforce_service.get_org_schema_for_objects reads.
+
+    Per-object field lists are written into a new versioned keyspace in pipelined
+    chunks while the crawl is still running. publish() then writes the master
+    object list and flips the version pointer in a single MULTI/EXEC, so the app
+    switches from the old cache to the complete new one atomically.
+    """
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+        self.version = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+        self.object_names = set()
+        self.labels = {}
+        self._pending = {}
+
+    def add(self, name, fields, label=None):
+        self._pending[schema_key(self.version, f"sobject:{name}")] = json.dumps(fields)
+        self.object_names.add(name)
+        if label:
+            self.labels[name] = label
+        if len(self._pending) >= REDIS_PIPELINE_CHUNK:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        for key, value in self._pending.items():
+            pipe.set(key, value)
+        pipe.execute()
+        self._pending = {}
+
+    def publish(self, expected_names=()):
+        """
+        Makes this crawl's keyspace the live one. Objects that exist in the org but
+        could not be described this time are carried over from the previous version.
+        """
+        self._flush()
+        previous_version = self.redis.get(SCHEMA_VERSION_KEY)
+        missing = sorted(set(expected_names) - self.object_names)
+        if missing:
+            old_values = self.redis.mget([schema_key(previous_version, f"sobject:{name}") for name in missing])
+            old_labels = json.loads(self.redis.get(schema_key(previous_version, OBJECT_LABELS_KEY)) or "{}")
+            carried = {name: value for name, value in zip(missing, old_values) if value}
+            for name, value in carried.items():
+                self.add(name, json.loads(value), old_labels.get(name))
+            self._flush()
+            print(f"Carried over {len(carried)}/{len(missing)} undescribed objects from the previous schema cache.")
+
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.set(schema_key(self.version, ALL_OBJECT_NAMES_KEY), json.dumps(sorted(self.object_names)))
+        pipe.set(schema_key(self.version, OBJECT_LABELS_KEY), json.dumps(self.labels))
+        pipe.set(SCHEMA_VERSION_KEY, self.version)
+        pipe.execute()
+
+        if previous_version and previous_version != self.version:
+            self._expire_keyspace(previous_version)
+
+    def discard(self):
+        """Removes a partially written keyspace after a failed crawl."""
+        self._pending = {}
+        self._expire_keyspace(self.version, ttl=0)
+
+    def _expire_keyspace(self, version, ttl=REDIS_OLD_VERSION_TTL):
+        pipe = self.redis.pipeline(transaction=False)
+        for i, key in enumerate(self.redis.scan_iter(match=f"v{version}:*", count=1000), start=1):
+            pipe.expire(key, ttl)
+            if i % REDIS_PIPELINE_CHUNK == 0:
+                pipe.execute()
+        pipe.execute()
+
+def load_manifest(path=INDEX_MANIFEST_PATH):
+    """
+    Loads the manifest written by the previous run: the content hash of every
+    indexed document id and the time that run started.
+    """
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"last_run": None, "documents": {}}
+
+def save_manifest(manifest, path=INDEX_MANIFEST_PATH):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
 
-def run_indexing_pipeline():
-    """Main function to run the entire indexing process."""
+def _content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _removed_document_ids(previous_ids, seen_ids):
+    """Ids from the last run that no longer exist in the org (skipping categories that failed to fetch)."""
+    return [
+        doc_id for doc_id in previous_ids
+        if doc_id not in seen_ids and f"{doc_id.split(':', 1)[0]}:*" not in seen_ids
+    ]
+
+def run_indexing_pipeline(incremental=False, embedding_cache=None, sf_client=None, redis_client=None):
+    """
+    Main function to run the entire indexing process.
+
+    In incremental mode only documents whose content hash differs from the
+    manifest are embedded and upserted, and Apex class bodies are only
+    downloaded if they were modified since the last successful run.
+    Vectors found in embedding_cache are reused instead of being re-embedded.
+
+    sf_client and redis_client default to connections made from the environment;
+    benchmarks can pass local stand-ins instead. Returns the embedding stats, or
+    None if a client could not be set up.
+    """
     print("--- Starting Salesforce Metadata Indexing Pipeline ---")
     load_dotenv()
     
     # --- 1. Initialize Clients ---
+    use_local_index = is_local_store_configured(os.environ)
     try:
-        print("Initializing OpenAI and Pinecone clients...")
-        openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+        # SDKs are imported here rather than at module level, so exporting the embedding
+        # cache (or importing this module from a benchmark) doesn't pay for them.
+        from openai import AsyncOpenAI
+        print(f"Initializing OpenAI{'' if use_local_index else ' and Pinecone'} clients...")
+        openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        if not use_local_index:
+            from pinecone import Pinecone, ServerlessSpec
+        pc = None if use_local_index else Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+        if redis_client is None and os.getenv("REDIS_HOST"):
+            print("Initializing Redis client...")
+            import redis
+            redis_client = redis.Redis(
+                host=os.getenv("REDIS_HOST"), port=int(os.getenv("REDIS_PORT", 6379)),
+                username=os.getenv("REDIS_USERNAME"), password=os.getenv("REDIS_PASSWORD"),
+                ssl=True, ssl_cert_reqs="required", decode_responses=True
+            )
+            redis_client.ping()
+        elif redis_client is None:
+            print("REDIS_HOST not set; the Redis schema cache will not be refreshed.")
         print("✅ Clients initialized.")
     except Exception as e:
         print(f"❌ ERROR: Could not initialize clients. {e}"); return
 
-    # --- 2. Connect to Pinecone Index ---
-    try:
-        print(f"Connecting to Pinecone index '{PINECONE_INDEX_NAME}'...")
-        if PINECONE_INDEX_NAME not in pc.list_indexes().names():
-            print(f"Index not found. Creating a new serverless index with dimension {VECTOR_DIMENSION}...")
-            pc.create_index(
-                name=PINECONE_INDEX_NAME,
-                dimension=VECTOR_DIMENSION,
-                metric="cosine",
-                spec=ServerlessSpec(cloud='aws', region='us-west-2')
-            )
-        index = pc.Index(PINECONE_INDEX_NAME)
-        print("✅ Connected to Pinecone index.")
-    except Exception as e:
-        print(f"❌ ERROR: Could not connect to or create Pinecone index. {e}"); return
+    # --- 2. Connect to the Vector Index ---
+    if use_local_index:
+        local_index_path = os.getenv("LOCAL_INDEX_PATH", DEFAULT_LOCAL_INDEX_PATH)
+        print(f"Opening local vector index at '{local_index_path}'...")
+        from services.local_vector_index import LocalVectorIndex
+        index = LocalVectorIndex(local_index_path, quantize=os.getenv("LOCAL_INDEX_QUANTIZE", "").lower() in ("1", "true", "yes"))
+        print("✅ Local vector index ready.")
+    else:
+        try:
+            print(f"Connecting to Pinecone index '{PINECONE_INDEX_NAME}'...")
+            if PINECONE_INDEX_NAME not in pc.list_indexes().names():
+                print(f"Index not found. Creating a new serverless index with dimension {VECTOR_DIMENSION}...")
+                pc.create_index(
+                    name=PINECONE_INDEX_NAME,
+                    dimension=VECTOR_DIMENSION,
+                    metric="cosine",
+                    spec=ServerlessSpec(cloud='aws', region='us-west-2')
+                )
+            index = pc.Index(PINECONE_INDEX_NAME)
+            print("✅ Connected to Pinecone index.")
+        except Exception as e:
+            print(f"❌ ERROR: Could not connect to or create Pinecone index. {e}"); return
         
     # --- 3. Connect to Salesforce ---
     print("Connecting to Salesforce...")
-    sf_client = salesforce_service.connect_to_salesforce(
-        username=os.getenv("SF_USERNAME"),
-        consumer_key=os.getenv("SF_CONSUMER_KEY"),
-        private_key=os.getenv("SF_PRIVATE_KEY")
-    )
+    if sf_client is None:
+        sf_client = connect_to_salesforce(
+            username=os.getenv("SF_USERNAME"),
+            consumer_key=os.getenv("SF_CONSUMER_KEY"),
+            private_key=os.getenv("SF_PRIVATE_KEY")
+        )
     if not sf_client: print("❌ ERROR: Could not connect to Salesforce."); return
     print("✅ Salesforce connection successful.")
 
     # --- 4. Fetch, Embed, and Upsert Metadata in Batches ---
-    print("\n--- Starting Metadata Embedding and Upserting ---")
-    batch_size = 100
-    vectors_to_upsert = []
-    
-    for doc in get_metadata_documents(sf_client):
+    # A local index keeps its own manifest next to the vectors so the two can't drift apart.
+    manifest_path = INDEX_MANIFEST_PATH
+    if use_local_index and not os.getenv("INDEX_MANIFEST_PATH"):
+        manifest_path = os.path.join(index.path, "manifest.json")
+    manifest = load_manifest(manifest_path)
+    previous_hashes = manifest["documents"]
+    modified_since = manifest["last_run"] if incremental else None
+    run_started_at = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    seen_ids, current_hashes = set(), {}
+
+    schema_writer = RedisSchemaWriter(redis_client) if redis_client else None
+
+    def changed_documents(documents):
+        for doc in documents:
+            if schema_writer and "fields" in doc:
+                schema_writer.add(doc["metadata"]["name"], doc["fields"], doc["label"])
+            current_hashes[doc["id"]] = _content_hash(doc["text"])
+            if incremental and previous_hashes.get(doc["id"]) == current_hashes[doc["id"]]:
+                continue
+            yield doc
+
+    print(f"\n--- Starting Metadata Embedding and Upserting ({f'incremental, changes since {modified_since}' if modified_since else 'full reindex'}) ---")
+    documents = get_metadata_documents(sf_client, modified_since=modified_since, seen_ids=seen_ids)
+    try:
+        stats = asyncio.run(embed_and_upsert_documents(changed_documents(documents), openai_client, index, embedding_cache))
+    except Exception:
+        if schema_writer:
+            schema_writer.discard()
+        raise
+    print(f"Embedded {stats['embedded']}/{stats['documents']} documents in {stats['requests']} embedding requests.")
+    if incremental:
+        print(f"Skipped {len(current_hashes) - stats['documents']} unchanged documents.")
+
+    # --- 5. Publish the Redis Schema Cache Used by the App ---
+    if schema_writer:
         try:
-            embedding = openai_client.embeddings.create(
-                input=[doc["text"]],
-                model=EMBEDDING_MODEL
-            ).data[0].embedding
-            
-            vectors_to_upsert.append({
-                "id": doc["id"],
-                "values": embedding,
-                "metadata": doc["metadata"]
-            })
-            
-            if len(vectors_to_upsert) >= batch_size:
-                print(f"Upserting batch of {len(vectors_to_upsert)} vectors...")
-                index.upsert(vectors=vectors_to_upsert)
-                vectors_to_upsert = []
+            print(f"Publishing Redis schema cache version {schema_writer.version}...")
+            schema_writer.publish(expected_names=[doc_id.split(":", 1)[1] for doc_id in seen_ids if doc_id.startswith("sobject:")])
+            print(f"✅ Redis schema cache now serves {len(schema_writer.object_names)} objects.")
+        except Exception as e:
+            print(f"  - ⚠️ WARNING: Could not publish the Redis schema cache. Reason: {e}")
 
+    # --- 6. Delete Vectors for Metadata Removed from the Org ---
+    removed_ids = _removed_document_ids(previous_hashes, seen_ids)
+    if removed_ids:
+        print(f"Deleting {len(removed_ids)} vectors for metadata that no longer exists...")
+        try:
+            for i in range(0, len(removed_ids), 1000):
+                index.delete(ids=removed_ids[i:i + 1000])
         except Exception as e:
-            print(f"  - ⚠️ WARNING: Could not process document {doc['id']}. Reason: {e}")
+            print(f"  - ⚠️ WARNING: Could not delete removed vectors. Reason: {e}")
+            removed_ids = []
 
-    if vectors_to_upsert:
-        print(f"Upserting final batch of {len(vectors_to_upsert)} vectors...")
-        index.upsert(vectors=vectors_to_upsert)
+    if use_local_index:
+        index.save()
+        print(f"✅ Local vector index saved to {index.path}.")
+
+    # --- 7. Save the Manifest ---
+    # last_run only advances after a clean run, so anything that failed is picked up again next time.
+    clean_run = stats["embedded"] == stats["documents"] and not any(doc_id.endswith(":*") for doc_id in seen_ids)
+    removed_ids = set(removed_ids)
+    manifest_documents = {doc_id: h for doc_id, h in previous_hashes.items() if doc_id not in removed_ids}
+    manifest_documents.update({doc_id: current_hashes[doc_id] for doc_id in stats["written_ids"]})
+    save_manifest({
+        "last_run": run_started_at if clean_run else manifest["last_run"],
+        "documents": manifest_documents
+    }, manifest_path)
+    print(f"✅ Manifest saved to {manifest_path} ({len(manifest_documents)} documents).")
 
     print("\n--- Indexing Pipeline Finished ---")
     print("Final index stats:")
     print(index.describe_index_stats())
+    if embedding_cache:
+        print(f"Embedding cache: {embedding_cache.stats_line()}")
+    return stats
 
 
 if __name__ == "__main__":
-    run_indexing_pipeline()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Index Salesforce metadata into the vector index (Pinecone or local) and the Redis schema cache.")
+    parser.add_argument("--incremental", action="store_true", help="Only re-embed metadata that changed since the last run.")
+    parser.add_argument("--no-embedding-cache", action="store_true", help="Always request fresh embeddings from OpenAI.")
+    parser.add_argument("--warm-embedding-cache", metavar="FILE", help="Pre-load the embedding cache from an exported JSONL file.")
+    parser.add_argument("--export-embedding-cache", metavar="FILE", help="Export the embedding cache to a JSONL file and exit.")
+    args = parser.parse_args()
+
+    cache = None
+    if not args.no_embedding_cache:
+        cache = EmbeddingCache(
+            path=os.getenv("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH),
+            max_bytes=int(os.getenv("EMBEDDING_CACHE_MAX_MB", DEFAULT_MAX_BYTES // 1024 ** 2)) * 1024 ** 2
+        )
+        if args.warm_embedding_cache:
+            print(f"✅ Pre-warmed embedding cache with {cache.import_file(args.warm_embedding_cache)} vectors.")
+        if args.export_embedding_cache:
+            print(f"✅ Exported {cache.export_file(args.export_embedding_cache, model=EMBEDDING_MODEL)} vectors to {args.export_embedding_cache}.")
+            raise SystemExit(0)
+
+    run_indexing_pipeline(incremental=args.incremental, embedding_cache=cache)
\ No newline at end of file
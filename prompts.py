@@ -1,11 +1,17 @@
 # prompts.py
 
-def get_triage_prompt(user_story, schema_context):
+# --- Cacheable prompt prefixes ---
+# Each long prompt is split into a stable prefix and a variable suffix. Calls that share
+# a prefix byte-for-byte (the schema block across triage, solution and technical design;
+# the full context across every file of a code generation run) can be served from the
+# provider's prompt cache, so only the suffix is processed at full input-token cost.
+
+def get_schema_context_prefix(user_story, schema_context):
     """
-    Creates the initial prompt to analyze a user story with org context.
+    Shared leading block of the triage, final-solution and technical prompts.
     """
     return f"""
-    You are a Senior Salesforce Business Analyst AI. Your single most important rule is to ground all of your responses in the Salesforce Org Schema Context provided. The context is your absolute source of truth. If information in the user story seems to conflict with the schema, you must use the schema and point out the discrepancy.
+    You are a Salesforce AI working from a specific org's schema. Your single most important rule is to ground all of your responses in the Salesforce Org Schema Context provided. The context is your absolute source of truth. If information in the user story seems to conflict with the schema, you must use the schema and point out the discrepancy.
 
     <salesforce_schema>
     {schema_context}
@@ -14,6 +20,14 @@ def get_triage_prompt(user_story, schema_context):
     <user_story>
     {user_story}
     </user_story>
+    """
+
+def get_triage_prompt_parts(user_story, schema_context):
+    """
+    Creates the initial prompt to analyze a user story with org context, as (cacheable prefix, suffix).
+    """
+    return get_schema_context_prefix(user_story, schema_context), """
+    You are acting as a Senior Salesforce Business Analyst.
 
     Analyze the <user_story> using only the information within the <salesforce_schema>. Respond ONLY with a JSON object with a "status" field.
     - If the story is perfectly clear and can be accomplished with the given schema, set "status" to "clear" and include a "solution" field with the generated Solution Overview.
@@ -21,68 +35,64 @@ def get_triage_prompt(user_story, schema_context):
     - For each question object, include a "question", "options", and a "type" ('single' or 'multiple').
     """
 
-def get_final_solution_prompt(user_story, context_from_answers, schema_context):
+def get_final_solution_prompt_parts(user_story, context_from_answers, schema_context):
     """
-    Creates the prompt for a final Solution Overview using org and user context.
+    Creates the prompt for a final Solution Overview using org and user context, as (cacheable prefix, suffix).
     """
-    return f"""
-    Based on the original user story, the provided Salesforce schema, AND the new user clarifications, generate a final, comprehensive Solution Overview. 
-    
-    **Mandatory Rule:** Your solution **MUST** exclusively reference objects and fields present in the <salesforce_schema>.
-
-    <salesforce_schema>
-    {schema_context}
-    </salesforce_schema>
-
-    <user_story>
-    {user_story}
-    </user_story>
-
+    return get_schema_context_prefix(user_story, schema_context), f"""
     <user_clarifications>
     {context_from_answers}
     </user_clarifications>
+
+    Based on the original user story, the provided Salesforce schema, AND the new user clarifications, generate a final, comprehensive Solution Overview. 
     
+    **Mandatory Rule:** Your solution **MUST** exclusively reference objects and fields present in the <salesforce_schema>.
+
     Generate the final Solution Overview now.
     """
 
-def get_technical_solution_prompt(user_story, solution_overview, schema_context):
+def get_technical_solution_prompt_parts(user_story, solution_overview, schema_context):
     """
-    Creates the prompt for the Technical Architect AI with org context.
+    Creates the prompt for the Technical Architect AI with org context, as (cacheable prefix, suffix).
     """
-    return f"""
-    You are a Salesforce Technical Architect. Your primary goal is to leverage standard Salesforce features wherever possible.
-
-    **Mandatory Rule:** You **MUST** create a solution that exclusively uses the objects and fields provided in the <salesforce_schema>. Do not suggest creating new objects or fields. Your solution's credibility depends on strictly adhering to the provided schema.
-
-    <salesforce_schema>
-    {schema_context}
-    </salesforce_schema>
-
-    <user_story>
-    {user_story}
-    </user_story>
-
+    return get_schema_context_prefix(user_story, schema_context), f"""
     <solution_overview>
     {solution_overview}
     </solution_overview>
 
+    You are acting as a Salesforce Technical Architect. Your primary goal is to leverage standard Salesforce features wherever possible.
+
+    **Mandatory Rule:** You **MUST** create a solution that exclusively uses the objects and fields provided in the <salesforce_schema>. Do not suggest creating new objects or fields. Your solution's credibility depends on strictly adhering to the provided schema.
+
     Generate a technical solution direction for a Salesforce developer that is consistent with the provided <salesforce_schema>.
     
     **CRITICAL INSTRUCTION:** For every component you design (Apex Class, Trigger, LWC, etc.), you **MUST** state its full, deployable file name on its own line, for example: `File: MyTriggerHandler.cls`. This is required for the system to parse the files for code generation.
     """
 
-def get_single_file_code_prompt(full_context, file_path):
+def get_single_file_code_prompt_parts(full_context, file_path, dependency_code=None):
     """
-    Creates a simpler prompt to generate only one file at a time, specifying the full path.
+    Creates a simpler prompt to generate only one file at a time, specifying the full path, as
+    (cacheable prefix, suffix). The prefix is identical for every file of a generation run.
+    dependency_code optionally maps already-generated files this file depends on to their code.
     """
-    return f"""
+    prefix = f"""
     You are an expert Salesforce Developer AI. Your task is to generate the complete and correct source code for a single Salesforce file based on the provided context.
 
     **Full Context (User Story, Solution, and Technical Design):**
     <context>
     {full_context}
     </context>
-
+    """
+    dependencies_block = ""
+    if dependency_code:
+        files = "\n".join(f"--- File: {name} ---\n{code}" for name, code in dependency_code.items())
+        dependencies_block = f"""
+    **Already Generated Files This File Depends On (use their exact class, method and field names):**
+    <dependencies>
+    {files}
+    </dependencies>
+"""
+    return prefix, f"""{dependencies_block}
     **Instruction:**
     Generate the complete source code for the following file path ONLY: **{file_path}**
 
@@ -117,10 +127,38 @@ def get_entity_extraction_prompt(user_story):
     Your output MUST be a single, valid JSON object containing one key, "objects", which is an array of strings.
     """
 
-def get_chat_system_prompt():
+def get_chat_system_prompt(conversation_summary=None):
     """
     Creates the system prompt that defines the Chatbot's persona and capabilities.
+    Older turns of a long conversation are passed in as a summary instead of verbatim.
     """
-    return """
+    prompt = """
     You are "Design Orchestrator," an expert AI assistant specializing in Salesforce solution architecture.
-    """
\ No newline at end of file
+    """
+    if conversation_summary:
+        prompt += f"""
+    Earlier parts of this conversation are summarized below; the most recent messages follow verbatim.
+    <conversation_summary>
+    {conversation_summary}
+    </conversation_summary>
+    """
+    return prompt
+
+def get_conversation_summary_prompt(previous_summary, messages):
+    """
+    Creates a prompt to fold older chat messages into the running conversation summary.
+    """
+    transcript = "\n\n".join(f"{m['role'].upper()}: {m['content']}" for m in messages)
+    return f"""
+    You maintain the running summary of a conversation between a user and a Salesforce solution architecture assistant.
+
+    <current_summary>
+    {previous_summary or "(empty)"}
+    </current_summary>
+
+    <new_messages>
+    {transcript}
+    </new_messages>
+
+    Rewrite the summary so it also covers the new messages. Keep every decision, requirement, Jira ticket id, Salesforce object and field name, file name and open question; drop pleasantries and restated content. Condense pasted user stories to their essential requirements. Respond with the updated summary only, in at most 400 words.
+    """
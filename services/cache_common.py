@@ -0,0 +1,47 @@
+# services/cache_common.py
+# Shared by the app and the offline cache_builder.py. Kept free of streamlit and numpy,
+# so importing cache_builder (a CLI) doesn't pay for the app's UI stack.
+
+# --- Redis Schema Cache Layout ---
+# cache_builder.py writes every crawl into its own versioned keyspace ("v<version>:...")
+# and then points SCHEMA_VERSION_KEY at it, so readers never see a half-built cache.
+# Caches written before versioning existed live at the bare keys (version None).
+SCHEMA_VERSION_KEY = "sfdc:schema_version"
+ALL_OBJECT_NAMES_KEY = "sfdc:all_object_names"
+OBJECT_LABELS_KEY = "sfdc:object_labels"
+
+def schema_key(version, key):
+    """
+    Returns the Redis key for a schema cache entry within the given keyspace version.
+    """
+    return f"v{version}:{key}" if version else key
+
+# --- Metadata Index Configuration ---
+PINECONE_INDEX_NAME = "salesforce-knowledge"
+EMBEDDING_MODEL = "text-embedding-3-small"
+VECTOR_DIMENSION = 1536
+DEFAULT_LOCAL_INDEX_PATH = "local_index"
+
+def is_local_store_configured(config):
+    """True when VECTOR_STORE = "local" in the given config mapping (st.secrets or os.environ)."""
+    return str(config.get("VECTOR_STORE", "pinecone")).lower() == "local"
+
+# --- Salesforce Connection ---
+def connect_to_salesforce(username, consumer_key, private_key):
+    """
+    Connects to Salesforce using JWT Bearer Flow with provided credentials.
+    This is used by the offline cache_builder.py script.
+    """
+    from simple_salesforce import Salesforce
+    if not all([username, consumer_key, private_key]):
+        print("ERROR: Salesforce credentials were not provided.")
+        return None
+    try:
+        return Salesforce(
+            username=username,
+            consumer_key=consumer_key,
+            privatekey=private_key
+        )
+    except Exception as e:
+        print(f"ERROR: Failed to connect to Salesforce: {e}")
+        return None
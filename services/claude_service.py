@@ -1,109 +1,110 @@
 # services/claude_service.py
 
 import streamlit as st
-import anthropic
-import json
+from services import llm_gateway
 from prompts import (
-    get_triage_prompt, 
-    get_final_solution_prompt, 
-    get_technical_solution_prompt, 
-    get_single_file_code_prompt,
+    get_triage_prompt_parts,
+    get_final_solution_prompt_parts,
+    get_technical_solution_prompt_parts,
+    get_single_file_code_prompt_parts,
     get_chat_system_prompt,
+    get_conversation_summary_prompt,
     get_entity_extraction_prompt,
     get_dependency_analysis_prompt
 )
 
 # --- Initialization ---
-CLIENT_INITIALIZED = False
-try:
-    if "ANTHROPIC_API_KEY" in st.secrets and st.secrets["ANTHROPIC_API_KEY"]:
-        client = anthropic.Anthropic(api_key=st.secrets["ANTHROPIC_API_KEY"])
-        CLIENT_INITIALIZED = True
-except Exception as e:
-    st.error(f"Failed to initialize Anthropic client. Error: {e}")
+# The Anthropic client itself lives in llm_gateway, which handles pooling, retries and timeouts.
+PROVIDER = "Claude"
 
 ANALYSIS_MODEL_NAME = "claude-sonnet-4-20250514"
 CODE_GENERATION_MODEL_NAME = "claude-opus-4-20250514" 
+MAX_CONCURRENT_REQUESTS = 4     # Parallel code-generation calls, kept under Anthropic rate limits
 
 def _is_client_configured():
-    if not CLIENT_INITIALIZED:
+    # Checked per call rather than at import, so importing the service never touches st.secrets.
+    if not llm_gateway.is_configured(PROVIDER):
         st.error("Anthropic API key not found. Please add it to your secrets.")
-    return CLIENT_INITIALIZED
+        return False
+    return True
 
 def extract_entities_from_story(user_story):
     if not _is_client_configured(): return []
     user_prompt = get_entity_extraction_prompt(user_story)
     try:
-        response = client.messages.create(model=ANALYSIS_MODEL_NAME, max_tokens=1024,temperature=0.0, messages=[{"role": "user", "content": user_prompt}])
-        response_text = response.content[0].text.strip()
-        if response_text.startswith("```json"): response_text = response_text[7:-3]
-        response_data = json.loads(response_text)
+        response_text = llm_gateway.complete(PROVIDER, "entity_extraction", ANALYSIS_MODEL_NAME, prompt=user_prompt, max_tokens=1024, hedge=True)
+        response_data = llm_gateway.parse_json_response(response_text)
         return response_data.get("objects", []) if response_data else []
     except Exception as e:
         st.error(f"An error occurred during entity extraction: {e}"); return []
 
 def analyze_story(user_story, schema_context):
     if not _is_client_configured(): return None
-    user_prompt = get_triage_prompt(user_story, schema_context)
     try:
-        response = client.messages.create(model=ANALYSIS_MODEL_NAME, max_tokens=2048,temperature=0.0, messages=[{"role": "user", "content": user_prompt}])
-        response_text = response.content[0].text.strip()
-        if response_text.startswith("```json"): response_text = response_text[7:-3]
-        return json.loads(response_text)
+        response_text = llm_gateway.complete(PROVIDER, "triage", ANALYSIS_MODEL_NAME, prompt=get_triage_prompt_parts(user_story, schema_context), max_tokens=2048)
+        return llm_gateway.parse_json_response(response_text)
     except Exception as e:
         st.error(f"An error occurred during story analysis: {e}"); return None
 
+def stream_solution_with_answers(user_story, context_from_answers, schema_context):
+    if not _is_client_configured(): yield "Error: Anthropic client not initialized."; return
+    yield from llm_gateway.guarded_stream(
+        llm_gateway.stream(PROVIDER, "solution_with_answers", ANALYSIS_MODEL_NAME, prompt=get_final_solution_prompt_parts(user_story, context_from_answers, schema_context)),
+        "An error occurred with the Anthropic API", "Sorry, an error occurred with the AI."
+    )
+
 def generate_solution_with_answers(user_story, context_from_answers, schema_context):
-    if not _is_client_configured(): return "Error: Anthropic client not initialized."
-    user_prompt = get_final_solution_prompt(user_story, context_from_answers, schema_context)
-    try:
-        response = client.messages.create(model=ANALYSIS_MODEL_NAME, max_tokens=4096,temperature=0.0, messages=[{"role": "user", "content": user_prompt}])
-        return response.content[0].text
-    except Exception as e:
-        st.error(f"An error occurred with the Anthropic API: {e}"); return "Sorry, an error occurred with the AI."
+    return "".join(stream_solution_with_answers(user_story, context_from_answers, schema_context))
 
-def generate_technical_solution(user_story, solution_overview, schema_context):
-    if not _is_client_configured(): return "Error: Anthropic client not initialized."
-    user_prompt = get_technical_solution_prompt(user_story, solution_overview, schema_context)
-    try:
-        response = client.messages.create(model=ANALYSIS_MODEL_NAME, max_tokens=4096,temperature=0.0, messages=[{"role": "user", "content": user_prompt}])
-        return response.content[0].text
-    except Exception as e:
-        st.error(f"An error occurred with the Anthropic API: {e}"); return "Sorry, an error occurred with the AI."
+def stream_technical_solution(user_story, solution_overview, schema_context):
+    if not _is_client_configured(): yield "Error: Anthropic client not initialized."; return
+    yield from llm_gateway.guarded_stream(
+        llm_gateway.stream(PROVIDER, "technical_solution", ANALYSIS_MODEL_NAME, prompt=get_technical_solution_prompt_parts(user_story, solution_overview, schema_context)),
+        "An error occurred with the Anthropic API", "Sorry, an error occurred with the AI."
+    )
+
+def generate_technical_solution(user_story, solution_overview, schema_context, raise_errors=False):
+    """With raise_errors, a failed or truncated generation raises instead of returning an error or partial text (for headless callers)."""
+    if not raise_errors:
+        return "".join(stream_technical_solution(user_story, solution_overview, schema_context))
+    if not llm_gateway.is_configured(PROVIDER): raise RuntimeError("Anthropic client not initialized.")
+    return llm_gateway.complete(PROVIDER, "technical_solution", ANALYSIS_MODEL_NAME, prompt=get_technical_solution_prompt_parts(user_story, solution_overview, schema_context))
 
 def get_generation_order(filenames):
     if not _is_client_configured(): return filenames
     user_prompt = get_dependency_analysis_prompt(filenames)
     try:
-        response = client.messages.create(model=ANALYSIS_MODEL_NAME, max_tokens=1024,temperature=0.0, messages=[{"role": "user", "content": user_prompt}])
-        response_text = response.content[0].text.strip()
-        if response_text.startswith("```json"): response_text = response_text[7:-3]
-        response_data = json.loads(response_text)
+        response_text = llm_gateway.complete(PROVIDER, "generation_order", ANALYSIS_MODEL_NAME, prompt=user_prompt, max_tokens=1024, hedge=True)
+        response_data = llm_gateway.parse_json_response(response_text)
         return response_data.get("generation_order", filenames)
     except Exception as e:
         st.warning(f"Could not determine file dependencies, using default order. Reason: {e}")
         return filenames
 
-def generate_single_file_code(full_context, file_path):
+def stream_single_file_code(full_context, file_path, dependency_code=None):
+    """Raw deltas of the file's code; the caller strips any markdown fence once complete."""
+    if not _is_client_configured(): return
+    yield from llm_gateway.stream(PROVIDER, "single_file_code", CODE_GENERATION_MODEL_NAME, prompt=get_single_file_code_prompt_parts(full_context, file_path, dependency_code))
+
+def generate_single_file_code(full_context, file_path, dependency_code=None):
     if not _is_client_configured(): return None
-    user_prompt = get_single_file_code_prompt(full_context, file_path)
     try:
-        response = client.messages.create(model=CODE_GENERATION_MODEL_NAME, max_tokens=4096,temperature=0.0, messages=[{"role": "user", "content": user_prompt}])
-        response_text = response.content[0].text.strip()
-        if response_text.startswith("```"):
-            first_newline = response_text.find('\n')
-            if first_newline != -1: response_text = response_text[first_newline+1:]
-            if response_text.endswith("```"): response_text = response_text[:-3]
-        return response_text.strip()
+        return llm_gateway.strip_code_fences("".join(stream_single_file_code(full_context, file_path, dependency_code)))
     except Exception as e:
         st.error(f"An error occurred during code generation: {e}"); return f"// Error generating code for {file_path}: {e}"
 
-def get_chat_response(messages):
-    if not _is_client_configured(): return "Error: Anthropic client not initialized."
-    system_prompt = get_chat_system_prompt()
+def stream_chat_response(messages, conversation_summary=None):
+    if not _is_client_configured(): yield "Error: Anthropic client not initialized."; return
     claude_messages = [{"role": m["role"], "content": m["content"]} for m in messages]
-    try:
-        response = client.messages.create(model=ANALYSIS_MODEL_NAME, max_tokens=4096,temperature=0.0, system=system_prompt, messages=claude_messages)
-        return response.content[0].text
-    except Exception as e:
-        st.error(f"An error occurred with the Anthropic API: {e}"); return "Sorry, I encountered an error. Please try again."
\ No newline at end of file
+    yield from llm_gateway.guarded_stream(
+        llm_gateway.stream(PROVIDER, "chat", ANALYSIS_MODEL_NAME, messages=claude_messages, system=get_chat_system_prompt(conversation_summary)),
+        "An error occurred with the Anthropic API", "Sorry, I encountered an error. Please try again."
+    )
+
+def get_chat_response(messages, conversation_summary=None):
+    return "".join(stream_chat_response(messages, conversation_summary))
+
+def summarize_conversation(previous_summary, messages):
+    """Folds older chat messages into the running summary. Runs in the background, so it raises instead of using st.error."""
+    if not llm_gateway.is_configured(PROVIDER): raise RuntimeError("Anthropic client not initialized.")
+    return llm_gateway.complete(PROVIDER, "chat_summary", ANALYSIS_MODEL_NAME, prompt=get_conversation_summary_prompt(previous_summary, messages), max_tokens=1024).strip()
@@ -0,0 +1,45 @@
+# services/codegen_scheduler.py
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+def generate_files(generate, filenames, dependencies, max_workers, thread_initializer=None):
+    """
+    Runs generate(filename, dependency_code) for every file on a bounded thread pool.
+
+    A file is only started once all of its dependencies have finished, and receives
+    their generated code as dependency_code ({filename: code}); files with no edge
+    between them run concurrently. Yields (filename, code, error) as each file
+    finishes. A failing file is reported with its error and does not stop the rest;
+    its dependents are still generated, just without its code. Files caught in a
+    dependency cycle are started one at a time, each with the code of whichever of its
+    dependencies have finished.
+    """
+    remaining = {f: set(dependencies.get(f, ())) & set(filenames) for f in filenames}
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers, initializer=thread_initializer) as executor:
+        running = {}
+
+        def start_ready_files():
+            ready = [f for f, deps in remaining.items() if not deps]
+            if not ready and not running and remaining:
+                # Only reachable with a dependency cycle: break it by starting the file with the
+                # fewest unfinished dependencies, so the rest of the cycle still gets its code.
+                ready = [min(remaining, key=lambda f: len(remaining[f]))]
+            for filename in ready:
+                del remaining[filename]
+                dependency_code = {d: results[d] for d in dependencies.get(filename, ()) if results.get(d)}
+                running[executor.submit(generate, filename, dependency_code)] = filename
+
+        start_ready_files()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                filename = running.pop(future)
+                try:
+                    results[filename], error = future.result(), None
+                except Exception as e:
+                    results[filename], error = None, e
+                for deps in remaining.values():
+                    deps.discard(filename)
+                yield filename, results[filename], error
+            start_ready_files()
@@ -0,0 +1,74 @@
+# services/conversation.py
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from services import tokenizer
+
+# --- CONFIGURATION ---
+RECENT_MESSAGES = 8             # Sent verbatim: the last four user/assistant turns
+SUMMARY_BATCH_MESSAGES = 4      # Older messages are folded into the summary in batches of this many
+CHAT_TOKEN_BUDGET = 12000       # Summary + messages sent per turn
+MESSAGE_OVERHEAD_TOKENS = 4     # Role and formatting tokens the providers add per message
+
+_summary_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-summary")
+
+class ConversationManager:
+    """
+    Decides what a chat turn actually sends. The last RECENT_MESSAGES messages go
+    verbatim; anything older is folded into a rolling summary by a background job, so
+    summarizing never delays a reply. Until a batch is folded in, its messages are still
+    sent verbatim, and the oldest of them are dropped if the turn would exceed the
+    token budget. One instance lives in each session's state.
+    """
+
+    def __init__(self, recent_messages=RECENT_MESSAGES, token_budget=CHAT_TOKEN_BUDGET):
+        self.recent_messages = recent_messages
+        self.token_budget = token_budget
+        self.summary = ""
+        self.summarized_count = 0   # Leading messages already covered by the summary
+        self._lock = threading.Lock()
+        self._pending = None        # (future, number of leading messages it will cover)
+
+    def prepare(self, messages, summarize):
+        """
+        Returns (messages to send, conversation summary or None) for the next model call.
+        summarize(previous_summary, messages) -> new summary; it runs off the critical path.
+        """
+        with self._lock:
+            if len(messages) < self.summarized_count:
+                # The history was cleared or replaced; start over.
+                self.summary, self.summarized_count, self._pending = "", 0, None
+            self._collect_summary()
+            self._schedule_summary(messages, summarize)
+            window = list(messages[self.summarized_count:])
+            summary = self.summary or None
+
+        # Never open with an assistant message (e.g. the greeting); providers expect the user first.
+        while len(window) > 1 and window[0]["role"] == "assistant":
+            window.pop(0)
+        budget = self.token_budget - (tokenizer.count_tokens(summary) if summary else 0)
+        while len(window) > 1 and _messages_tokens(window) > budget:
+            window.pop(0)
+            while len(window) > 1 and window[0]["role"] == "assistant":
+                window.pop(0)
+        return window, summary
+
+    def _collect_summary(self):
+        if self._pending and self._pending[0].done():
+            future, covered = self._pending
+            self._pending = None
+            try:
+                self.summary, self.summarized_count = future.result(), covered
+            except Exception:
+                pass    # Keep the previous summary; the batch is retried on the next turn.
+
+    def _schedule_summary(self, messages, summarize):
+        foldable = len(messages) - self.recent_messages
+        if self._pending or foldable - self.summarized_count < SUMMARY_BATCH_MESSAGES:
+            return
+        batch = [dict(m) for m in messages[self.summarized_count:foldable]]
+        future = _summary_pool.submit(summarize, self.summary, batch)
+        self._pending = (future, foldable)
+
+def _messages_tokens(messages):
+    return sum(tokenizer.count_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages)
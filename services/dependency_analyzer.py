@@ -0,0 +1,120 @@
+# services/dependency_analyzer.py
+
+import os
+import re
+
+APEX_NOISE_PATTERN = re.compile(r"//[^\n]*|/\*.*?\*/|'(?:\\.|[^'\\])*'", re.DOTALL)
+IDENTIFIER_PATTERN = re.compile(r"\b[A-Za-z_]\w*\b")
+
+def _stem(filename):
+    """MyHandler.cls -> MyHandler, MyHandler.cls-meta.xml -> MyHandler, myCmp.js -> myCmp"""
+    name = os.path.basename(filename)
+    if name.endswith("-meta.xml"):
+        name = name[:-len("-meta.xml")]
+    return name.split(".", 1)[0]
+
+def _apex_references(code, classes):
+    """Class files referenced by name in Apex source. Apex is case-insensitive, so matching is too."""
+    code = APEX_NOISE_PATTERN.sub(" ", code)
+    return {classes[word.lower()] for word in IDENTIFIER_PATTERN.findall(code) if word.lower() in classes}
+
+def infer_dependencies(filenames, sources=None):
+    """
+    Derives dependency edges between files to be generated from Salesforce naming
+    conventions. Returns {filename: set(filenames it depends on)}.
+
+    Only edges where one file genuinely needs the other's code are produced:
+    a test class depends on the class it tests, a trigger on its handler, and an
+    LWC bundle's .html/.css on its .js. A -meta.xml file never depends on its
+    sibling, so both can be generated at once. When sources ({filename: code}) are
+    given, Apex files also depend on every class they reference.
+    """
+    classes = {_stem(f): f for f in filenames if f.endswith(".cls")}
+    components = {_stem(f): f for f in filenames if f.endswith(".js")}
+    dependencies = {f: set() for f in filenames}
+    for filename in filenames:
+        stem = _stem(filename)
+        if filename.endswith(".cls"):
+            for prefix, suffix in (("", "Test"), ("", "_Test"), ("Test", ""), ("Test_", "")):
+                if stem.startswith(prefix) and stem.endswith(suffix) and len(stem) > len(prefix + suffix):
+                    subject = classes.get(stem[len(prefix):len(stem) - len(suffix)])
+                    if subject and subject != filename:
+                        dependencies[filename].add(subject)
+        elif filename.endswith(".trigger"):
+            for handler_suffix in ("TriggerHandler", "Handler"):
+                handler = classes.get(stem + handler_suffix)
+                if handler:
+                    dependencies[filename].add(handler)
+        elif filename.endswith((".html", ".css")) and stem in components:
+            dependencies[filename].add(components[stem])
+
+    if sources:
+        classes_by_lower_name = {stem.lower(): f for stem, f in classes.items()}
+        for filename, code in sources.items():
+            if filename in dependencies and filename.endswith((".cls", ".trigger")) and code:
+                dependencies[filename] |= _apex_references(code, classes_by_lower_name) - {filename}
+    return dependencies
+
+def generation_order(filenames, sources=None):
+    """
+    Topologically sorts the files so every file comes after the files it depends on.
+    Ties keep the order the files were listed in, except that a -meta.xml file is
+    placed right after its source file. Returns (order, dependencies, cycles), where
+    cycles lists each group of files that depend on one another; those files are
+    appended at the end in their listed order.
+    """
+    filenames = list(dict.fromkeys(filenames))
+    dependencies = infer_dependencies(filenames, sources)
+    non_meta_files = {os.path.basename(f): f for f in filenames if not f.endswith("-meta.xml")}
+    meta_files = {}
+    for filename in filenames:
+        source = non_meta_files.get(os.path.basename(filename)[:-len("-meta.xml")]) if filename.endswith("-meta.xml") else None
+        if source:
+            meta_files.setdefault(source, []).append(filename)
+    attached_meta_files = {meta for metas in meta_files.values() for meta in metas}
+
+    remaining = {f: set(deps) for f, deps in dependencies.items() if f not in attached_meta_files}
+    order = []
+    while True:
+        ready = [f for f in filenames if f in remaining and not remaining[f]]
+        if not ready:
+            break
+        for filename in (ready[0], *meta_files.get(ready[0], ())):
+            order.append(filename)
+        del remaining[ready[0]]
+        for deps in remaining.values():
+            deps.discard(ready[0])
+
+    cycles = _find_cycles(remaining) if remaining else []
+    for filename in filenames:
+        if filename in remaining:
+            order.extend((filename, *meta_files.get(filename, ())))
+    return order, dependencies, cycles
+
+def _find_cycles(graph):
+    """Strongly connected components of size > 1 (or self-loops), via Tarjan's algorithm."""
+    index, low, stack, on_stack, cycles = {}, {}, [], set(), []
+
+    def visit(node):
+        index[node] = low[node] = len(index)
+        stack.append(node); on_stack.add(node)
+        for dep in graph.get(node, ()):
+            if dep not in index:
+                visit(dep)
+                low[node] = min(low[node], low[dep])
+            elif dep in on_stack:
+                low[node] = min(low[node], index[dep])
+        if low[node] == index[node]:
+            component = []
+            while True:
+                member = stack.pop(); on_stack.discard(member)
+                component.append(member)
+                if member == node:
+                    break
+            if len(component) > 1 or node in graph.get(node, ()):
+                cycles.append(sorted(component))
+
+    for node in graph:
+        if node not in index:
+            visit(node)
+    return cycles
@@ -0,0 +1,152 @@
+# services/embedding_cache.py
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+
+DEFAULT_CACHE_PATH = os.path.expanduser("~/.cache/salesforce-ai-mvp/embeddings.sqlite3")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+EVICTION_TARGET_RATIO = 0.9     # After evicting, the cache shrinks to this share of max_bytes
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """
+    Persistent SQLite-backed cache of embedding vectors keyed by (model, sha256(text)).
+    The key deliberately ignores which org a document came from, so identical text
+    (e.g. a managed Apex class deployed to several orgs) is only ever embedded once.
+    Least recently used entries are evicted once the stored vectors exceed max_bytes.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self.size_bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model, texts):
+        """Returns a list aligned with texts holding the cached vector, or None for a miss."""
+        hashes = [text_hash(text) for text in texts]
+        found = {}
+        with self._lock:
+            for i in range(0, len(hashes), 500):
+                chunk = hashes[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *chunk]
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, h) for h in found]
+                )
+                self._conn.commit()
+
+        results = [_unpack(found[h]) if h in found else None for h in hashes]
+        hit_count = sum(1 for vector in results if vector is not None)
+        self.hits += hit_count
+        self.misses += len(results) - hit_count
+        return results
+
+    def put_many(self, model, items):
+        """Stores (text, vector) pairs, then evicts old entries if the cache is over its size limit."""
+        self._put_hashed(model, [(text_hash(text), vector) for text, vector in items])
+
+    def _put_hashed(self, model, hashed_items):
+        if not hashed_items:
+            return
+        now = time.time()
+        blobs = {h: _pack(vector) for h, vector in hashed_items}    # A repeated text keeps its last vector
+        hashes = list(blobs)
+        with self._lock:
+            # size_bytes is kept up to date here rather than re-summed over the whole table:
+            # only the rows being replaced need looking up.
+            replaced_bytes = 0
+            for i in range(0, len(hashes), 500):
+                chunk = hashes[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                replaced_bytes += self._conn.execute(
+                    f"SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *chunk]
+                ).fetchone()[0]
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)",
+                                   [(model, h, blob, now) for h, blob in blobs.items()])
+            self._conn.commit()
+            self.size_bytes += sum(len(blob) for blob in blobs.values()) - replaced_bytes
+            if self.size_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        target = self.max_bytes * EVICTION_TARGET_RATIO
+        freed = 0
+        stale = []
+        for model, h, size in self._conn.execute(
+            "SELECT model, text_hash, LENGTH(vector) FROM embeddings ORDER BY last_used ASC"
+        ):
+            if self.size_bytes - freed <= target:
+                break
+            stale.append((model, h))
+            freed += size
+        self._conn.executemany("DELETE FROM embeddings WHERE model = ? AND text_hash = ?", stale)
+        self._conn.commit()
+        self.size_bytes -= freed
+
+    def export_file(self, path, model=None):
+        """Writes the cache (optionally one model only) as JSON lines for pre-warming another machine."""
+        query, params = "SELECT model, text_hash, vector FROM embeddings", []
+        if model:
+            query, params = query + " WHERE model = ?", [model]
+        count = 0
+        with self._lock, open(path, "w") as f:
+            for row_model, h, blob in self._conn.execute(query, params):
+                f.write(json.dumps({"model": row_model, "sha256": h, "embedding": _unpack(blob)}) + "\n")
+                count += 1
+        return count
+
+    def import_file(self, path):
+        """Pre-warms the cache from a file produced by export_file. Returns the number of vectors loaded."""
+        by_model = {}
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    by_model.setdefault(entry["model"], []).append((entry["sha256"], entry["embedding"]))
+        for model, hashed_items in by_model.items():
+            self._put_hashed(model, hashed_items)
+        return sum(len(items) for items in by_model.values())
+
+    def stats_line(self):
+        total = self.hits + self.misses
+        hit_rate = f"{self.hits / total:.0%}" if total else "n/a"
+        return f"{self.hits} hits, {self.misses} misses ({hit_rate} hit rate), {self.size_bytes / 1024 ** 2:.1f} MB on disk"
+
+    def close(self):
+        self._conn.close()
+
+def _pack(vector):
+    return array("f", vector).tobytes()
+
+def _unpack(blob):
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
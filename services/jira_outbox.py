@@ -0,0 +1,161 @@
+# services/jira_outbox.py
+
+import os
+import time
+import random
+import sqlite3
+import threading
+import streamlit as st
+from services import jira_service
+
+# --- CONFIGURATION ---
+OUTBOX_PATH = os.environ.get("JIRA_OUTBOX_PATH", os.path.expanduser("~/.cache/salesforce-ai-mvp/jira_outbox.sqlite3"))
+MAX_ATTEMPTS = 8                 # Then the entry is marked failed and left for a human
+BACKOFF_BASE_SECONDS = 2
+BACKOFF_MAX_SECONDS = 300
+IDLE_POLL_SECONDS = 30           # Worker wake-up when nothing is due; enqueue() wakes it at once
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+class JiraOutbox:
+    """
+    A durable queue of description appends, applied to Jira by one background worker.
+    Entries are written to SQLite before enqueue() returns, so they survive restarts;
+    pending appends to the same ticket and issue version are coalesced into a single
+    update. An entry whose issue was edited in Jira after it was queued is marked failed
+    rather than written. Other failed writes are retried with jittered exponential
+    backoff, up to MAX_ATTEMPTS.
+    """
+
+    def __init__(self, path=OUTBOX_PATH, apply=jira_service.update_story_description):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._apply = apply
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._own_writes = {}   # (ticket, issue version) -> the version our write to it produced
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS jira_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ticket_id TEXT NOT NULL,
+            content TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created REAL NOT NULL,
+            next_attempt REAL NOT NULL,
+            finished REAL,
+            expected_updated TEXT)""")
+        if "expected_updated" not in [c[1] for c in self._conn.execute("PRAGMA table_info(jira_outbox)")]:
+            # Outboxes created before the version check; their entries are applied unchecked.
+            self._conn.execute("ALTER TABLE jira_outbox ADD COLUMN expected_updated TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jira_outbox_due ON jira_outbox (status, next_attempt)")
+        self._conn.commit()
+        self._worker = threading.Thread(target=self._run, name="jira-outbox", daemon=True)
+        self._worker.start()
+
+    def enqueue(self, ticket_id, content, expected_updated=None):
+        """
+        Queues content to be appended to the ticket's description. expected_updated is the
+        issue's `updated` timestamp as the user saw it (jira_service.story_version); the
+        append is only written if the issue hasn't been edited since, other than by this
+        outbox. Returns the entry id.
+        """
+        ticket_id, now = ticket_id.upper(), time.time()
+        with self._lock:
+            while (ticket_id, expected_updated) in self._own_writes:
+                expected_updated = self._own_writes[(ticket_id, expected_updated)]
+            cursor = self._conn.execute("INSERT INTO jira_outbox (ticket_id, content, created, next_attempt, expected_updated) VALUES (?, ?, ?, ?, ?)",
+                                        (ticket_id, content, now, now, expected_updated))
+            self._conn.commit()
+        self._wake.set()
+        return cursor.lastrowid
+
+    def entries(self, ticket_id=None, limit=20):
+        """The most recent entries, newest first, as dicts for display."""
+        query = "SELECT id, ticket_id, status, attempts, last_error, created, next_attempt, finished FROM jira_outbox"
+        params = ()
+        if ticket_id:
+            query, params = query + " WHERE ticket_id = ?", (ticket_id.upper(),)
+        with self._lock:
+            cursor = self._conn.execute(query + " ORDER BY id DESC LIMIT ?", params + (limit,))
+            columns = [c[0] for c in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def counts(self):
+        """{status: number of entries} over the whole outbox."""
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM jira_outbox GROUP BY status").fetchall())
+
+    def _run(self):
+        while True:
+            try:
+                self._drain()
+            except Exception:
+                pass    # A broken database read must not kill the worker; try again later.
+            with self._lock:
+                row = self._conn.execute("SELECT MIN(next_attempt) FROM jira_outbox WHERE status = 'pending'").fetchone()
+            delay = IDLE_POLL_SECONDS if row[0] is None else min(IDLE_POLL_SECONDS, max(0.0, row[0] - time.time()))
+            self._wake.wait(delay)
+            self._wake.clear()
+
+    def _drain(self):
+        while True:
+            with self._lock:
+                row = self._conn.execute("SELECT ticket_id, expected_updated FROM jira_outbox WHERE status = 'pending' AND next_attempt <= ? ORDER BY id LIMIT 1",
+                                         (time.time(),)).fetchone()
+                if row is None:
+                    return
+                ticket_id, expected_updated = row
+                batch = self._conn.execute("SELECT id, content, attempts FROM jira_outbox WHERE ticket_id = ? AND expected_updated IS ? AND status = 'pending' ORDER BY id",
+                                           (ticket_id, expected_updated)).fetchall()
+            self._apply_batch(ticket_id, expected_updated, batch)
+
+    def _apply_batch(self, ticket_id, expected_updated, batch):
+        from jira import JIRAError
+        ids = [entry_id for entry_id, _, _ in batch]
+        attempts = max(a for _, _, a in batch) + 1
+        try:
+            # The queued appends for this ticket go out in one read-modify-write; each one is
+            # checked on its own against the description, so a retry never writes one twice.
+            updated = self._apply(ticket_id, [content for _, content, _ in batch], expected_updated)
+        except jira_service.StoryChangedError as e:
+            # Re-reading won't help: the user confirmed a version of the story that is gone.
+            self._finish(ids, "failed", attempts, str(e))
+            return
+        except JIRAError as e:
+            if e.status_code is not None and e.status_code not in RETRYABLE_STATUS_CODES:
+                # Bad ticket, permissions or credentials: retrying won't help.
+                self._finish(ids, "failed", attempts, f"{e.status_code}: {e.text}")
+                return
+            error = e
+        except Exception as e:
+            error = e
+        else:
+            with self._lock:
+                if expected_updated is not None and updated != expected_updated:
+                    # Entries queued against the version we just replaced follow our write.
+                    self._own_writes[(ticket_id, expected_updated)] = updated
+                    self._conn.execute("UPDATE jira_outbox SET expected_updated = ? WHERE ticket_id = ? AND expected_updated = ? AND status = 'pending'",
+                                       (updated, ticket_id, expected_updated))
+                    self._conn.commit()
+            self._finish(ids, "applied", attempts)
+            return
+        if attempts >= MAX_ATTEMPTS:
+            self._finish(ids, "failed", attempts, str(error))
+            return
+        backoff = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+        with self._lock:
+            self._conn.executemany("UPDATE jira_outbox SET attempts = ?, last_error = ?, next_attempt = ? WHERE id = ?",
+                                   [(attempts, str(error), time.time() + random.uniform(0.5, 1.0) * backoff, entry_id) for entry_id in ids])
+            self._conn.commit()
+
+    def _finish(self, ids, status, attempts, error=None):
+        with self._lock:
+            self._conn.executemany("UPDATE jira_outbox SET status = ?, attempts = ?, last_error = ?, finished = ? WHERE id = ?",
+                                   [(status, attempts, error, time.time(), entry_id) for entry_id in ids])
+            self._conn.commit()
+
+@st.cache_resource(show_spinner=False)
+def get_outbox():
+    """The process-wide outbox; its worker also resumes entries left pending by a previous run."""
+    return JiraOutbox()
@@ -1,22 +1,39 @@
 # services/jira_service.py
 
+import threading
 import streamlit as st
-from jira import JIRA, JIRAError
+from cachetools import LRUCache, TTLCache
+
+# --- CONFIGURATION ---
+STORY_FIELDS = "summary,description,updated"    # All a story needs; never pull every field
+STORY_CACHE_TTL_SECONDS = 60                   # How long a fetched story is trusted without asking Jira
+JQL_KEYS_PER_QUERY = 100                       # Keeps "key in (...)" queries well under URL/JQL limits
+
+_story_cache_lock = threading.Lock()
+_story_freshness = TTLCache(maxsize=1024, ttl=STORY_CACHE_TTL_SECONDS)    # key -> updated, while fresh
+_story_texts = LRUCache(maxsize=1024)                                    # (key, updated) -> story text
+_story_versions = LRUCache(maxsize=1024)                                 # key -> updated of the text last returned
+
+@st.cache_resource(show_spinner=False)
+def _create_jira_client():
+    from jira import JIRA    # Deferred: the jira package is slow to import and only needed on first use.
+    # One authenticated session per process: the server-info handshake happens once, and
+    # the underlying requests.Session keeps its connections alive between calls.
+    return JIRA(
+        options={'server': st.secrets["JIRA_SERVER"]},
+        basic_auth=(
+            st.secrets["JIRA_USERNAME"],
+            st.secrets["JIRA_API_TOKEN"]
+        )
+    )
 
 def get_jira_client():
     """
-    Initializes and returns a JIRA client using credentials from secrets.
+    Returns the process-wide JIRA client, created from secrets on first use.
     """
+    from jira import JIRAError
     try:
-        jira_options = {'server': st.secrets["JIRA_SERVER"]}
-        jira_client = JIRA(
-            options=jira_options,
-            basic_auth=(
-                st.secrets["JIRA_USERNAME"],
-                st.secrets["JIRA_API_TOKEN"]
-            )
-        )
-        return jira_client
+        return _create_jira_client()
     except (KeyError, AttributeError) as e:
         st.error(f"Jira credentials not found in secrets.toml. Please check your configuration. Missing key: {e}")
         return None
@@ -24,44 +41,173 @@ def get_jira_client():
         st.error(f"Jira authentication failed: {e.status_code} - {e.text}")
         return None
 
+def _story_text(issue):
+    # Combine summary and description for the full context
+    return f"Summary: {issue.fields.summary}\n\nDescription:\n{issue.fields.description}"
+
+def _remember(issue):
+    text = _story_text(issue)
+    with _story_cache_lock:
+        _story_freshness[issue.key] = _story_versions[issue.key] = issue.fields.updated
+        _story_texts[(issue.key, issue.fields.updated)] = text
+    return text
+
+def _forget(ticket_id):
+    with _story_cache_lock:
+        _story_freshness.pop(ticket_id, None)
+
+def _search(jira, keys, fields):
+    """Issues for the given keys, via paginated "key in (...)" searches."""
+    from jira import JIRAError
+    issues = []
+    for i in range(0, len(keys), JQL_KEYS_PER_QUERY):
+        jql = f"key in ({', '.join(keys[i:i + JQL_KEYS_PER_QUERY])})"
+        try:
+            issues.extend(jira.search_issues(jql, fields=fields, maxResults=False, use_post=True))
+        except JIRAError as e:
+            if e.status_code != 400:
+                raise
+            # JQL rejects the whole query if any key doesn't exist; look the keys up one by one.
+            for key in keys[i:i + JQL_KEYS_PER_QUERY]:
+                try:
+                    issues.append(jira.issue(key, fields=fields))
+                except JIRAError as e:
+                    if e.status_code != 404:
+                        raise
+    return issues
+
+def fetch_stories(ticket_ids):
+    """
+    Fetches the summary and description of many Jira tickets at once.
+    Returns {ticket id: story text}; tickets that don't exist are left out.
+
+    Stories fetched within the last STORY_CACHE_TTL_SECONDS are served from memory.
+    Older cached stories are revalidated by their `updated` timestamp, which is a much
+    smaller response than the description; only changed or unseen stories are refetched.
+    """
+    return _fetch_stories(ticket_ids)[0]
+
+def _fetch_stories(ticket_ids):
+    """fetch_stories(), plus whether Jira could be asked at all (False after a reported error)."""
+    from jira import JIRAError
+    ticket_ids = list(dict.fromkeys(t.upper() for t in ticket_ids))
+    stories, stale, missing = {}, [], []
+    with _story_cache_lock:
+        for key in ticket_ids:
+            updated = _story_freshness.get(key)
+            if updated is not None and (key, updated) in _story_texts:
+                stories[key] = _story_texts[(key, updated)]
+            elif any(cached_key == key for cached_key, _ in _story_texts.keys()):
+                stale.append(key)
+            else:
+                missing.append(key)
+    if not stale and not missing:
+        return stories, True
+
+    jira = get_jira_client()
+    if not jira:
+        return stories, False
+
+    try:
+        for issue in _search(jira, stale, "updated") if stale else []:
+            with _story_cache_lock:
+                text = _story_texts.get((issue.key, issue.fields.updated))
+                if text is not None:
+                    _story_freshness[issue.key] = _story_versions[issue.key] = issue.fields.updated
+            if text is not None:
+                stories[issue.key] = text
+            else:
+                missing.append(issue.key)
+        for issue in _search(jira, missing, STORY_FIELDS) if missing else []:
+            stories[issue.key] = _remember(issue)
+    except JIRAError as e:
+        st.error(f"An error occurred while fetching from Jira: {e.text}")
+        return stories, False
+    return stories, True
+
 def fetch_story(ticket_id):
     """
     Fetches the summary and description of a Jira ticket.
     """
+    stories, reached_jira = _fetch_stories([ticket_id])
+    story_text = stories.get(ticket_id.upper())
+    if story_text is None and reached_jira:
+        st.error(f"Jira ticket '{ticket_id}' not found.")
+    return story_text
+
+def search_stories(jql):
+    """
+    Fetches the stories of all issues matching a JQL query in paginated searches that
+    request only the story fields. Returns {ticket id: story text}, in query order.
+    """
+    from jira import JIRAError
     jira = get_jira_client()
     if not jira:
-        return None
-        
+        return {}
+
     try:
-        issue = jira.issue(ticket_id)
-        # Combine summary and description for the full context
-        story_text = f"Summary: {issue.fields.summary}\n\nDescription:\n{issue.fields.description}"
-        return story_text
+        return {issue.key: _remember(issue) for issue in jira.search_issues(jql, fields=STORY_FIELDS, maxResults=False)}
     except JIRAError as e:
-        if e.status_code == 404:
-            st.error(f"Jira ticket '{ticket_id}' not found.")
-        else:
-            st.error(f"An error occurred while fetching from Jira: {e.text}")
-        return None
+        st.error(f"An error occurred while searching Jira: {e.text}")
+        return {}
+
+def story_version(ticket_id):
+    """
+    The `updated` timestamp of the ticket's story text as last returned by fetch_story(s),
+    i.e. the version the user is looking at; None if the ticket can't be fetched.
+    """
+    key = ticket_id.upper()
+    with _story_cache_lock:
+        version = _story_versions.get(key)
+    if version is None and _fetch_stories([key])[0]:
+        with _story_cache_lock:
+            version = _story_versions.get(key)
+    return version
+
+class StoryChangedError(Exception):
+    """The issue was edited by someone else after the write-back was queued."""
+
+def update_story_description(ticket_id, blocks, expected_updated=None):
+    """
+    Appends blocks of text to a ticket's description in one update. Blocks the description
+    already contains (from an earlier attempt that did land) are skipped. If expected_updated
+    is given, the issue's `updated` timestamp must still match it, otherwise StoryChangedError
+    is raised without writing. Returns the issue's `updated` timestamp after the call.
+    Errors are raised rather than shown, since this runs on the Jira outbox worker.
+    """
+    jira = _create_jira_client()
+    issue = jira.issue(ticket_id, fields="description,updated")
+    current_description = issue.fields.description or ""
+    new_blocks = [block for block in blocks if block not in current_description]
+    if not new_blocks:
+        return issue.fields.updated
+    # Jira has no conditional update, so this can't close the window between read and write.
+    if expected_updated is not None and issue.fields.updated != expected_updated:
+        raise StoryChangedError(f"{ticket_id} was edited in Jira after the write-back was queued.")
+    issue.update(description=current_description + "".join(new_blocks))
+    _forget(ticket_id)
+    return issue.fields.updated
 
 def append_to_story(ticket_id, content, content_type="Solution Overview"):
     """
     Appends content to a Jira ticket's description.
     """
+    from jira import JIRAError
     jira = get_jira_client()
     if not jira:
         return False
 
     try:
-        issue = jira.issue(ticket_id)
+        issue = jira.issue(ticket_id, fields="description")
         new_comment = f"\n\n---\n*AI Generated {content_type}:*\n{content}"
-        
+
         # Append the new content to the existing description
         current_description = issue.fields.description or ""
         issue.update(description=current_description + new_comment)
-        
+        _forget(ticket_id)
+
         st.success(f"Successfully appended {content_type} to Jira ticket {ticket_id}.")
         return True
     except JIRAError as e:
         st.error(f"Failed to update Jira ticket {ticket_id}: {e.text}")
-        return False
\ No newline at end of file
+        return False
@@ -0,0 +1,158 @@
+# services/llm_cache.py
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import contextvars
+from contextlib import contextmanager
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from cachetools import TTLCache
+
+DEFAULT_TTL_SECONDS = 24 * 3600
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_SQLITE_PATH = os.path.expanduser("~/.cache/salesforce-ai-mvp/llm_responses.sqlite3")
+REDIS_KEY_PREFIX = "llm_cache:"
+
+_bypass = contextvars.ContextVar("llm_cache_bypass", default=False)
+
+def _setting(name, default):
+    """Reads a setting from st.secrets, falling back to the environment (e.g. for CLI runs)."""
+    try:
+        if name in st.secrets:
+            return st.secrets[name]
+    except Exception:
+        pass
+    return os.environ.get(name, default)
+
+def request_key(provider, request):
+    """sha256 over the provider and the full request: model, messages/system and sampling params."""
+    payload = json.dumps({"provider": provider, "request": request}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+@contextmanager
+def bypass():
+    """Within this block, responses are neither read from nor written to the cache."""
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+def is_bypassed():
+    if _bypass.get():
+        return True
+    # The sidebar toggle; worker threads see it too once the script context is attached.
+    return get_script_run_ctx() is not None and st.session_state.get("llm_cache_enabled") is False
+
+class _SqliteTier:
+    def __init__(self, path, ttl):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS llm_responses (key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL)")
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM llm_responses WHERE key = ? AND created > ?", (key, time.time() - self.ttl)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key, response):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO llm_responses (key, response, created) VALUES (?, ?, ?)", (key, response, time.time()))
+            self._conn.execute("DELETE FROM llm_responses WHERE created <= ?", (time.time() - self.ttl,))
+            self._conn.commit()
+
+class _RedisTier:
+    def __init__(self, ttl):
+        from services.salesforce_service import get_redis_client
+        self.ttl = ttl
+        self._client = get_redis_client()
+
+    def get(self, key):
+        return self._client.get(REDIS_KEY_PREFIX + key)
+
+    def put(self, key, response):
+        self._client.set(REDIS_KEY_PREFIX + key, response, ex=self.ttl)
+
+class ResponseCache:
+    """
+    Memoizes complete LLM responses by request_key(). A bounded in-memory TTL/LRU tier
+    is shared by all sessions of the process; an optional SQLite or Redis tier
+    (LLM_CACHE_BACKEND) lets hits survive restarts or be shared between replicas.
+    A failing persistent tier only costs the hit, never the request.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES, backend=None):
+        self._lock = threading.Lock()
+        self._memory = TTLCache(maxsize=max_entries, ttl=ttl)
+        self._backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            response = self._memory.get(key)
+        if response is None and self._backend is not None:
+            try:
+                response = self._backend.get(key)
+            except Exception:
+                response = None
+            if response is not None:
+                with self._lock:
+                    self._memory[key] = response
+        with self._lock:
+            if response is None: self.misses += 1
+            else: self.hits += 1
+        return response
+
+    def put(self, key, response):
+        with self._lock:
+            self._memory[key] = response
+        if self._backend is not None:
+            try:
+                self._backend.put(key, response)
+            except Exception:
+                pass
+
+@st.cache_resource(show_spinner=False)
+def get_response_cache():
+    ttl = int(_setting("LLM_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+    backend_name = str(_setting("LLM_CACHE_BACKEND", "memory")).lower()
+    backend = None
+    try:
+        if backend_name == "sqlite":
+            backend = _SqliteTier(_setting("LLM_CACHE_PATH", DEFAULT_SQLITE_PATH), ttl)
+        elif backend_name == "redis":
+            backend = _RedisTier(ttl)
+    except Exception as e:
+        st.warning(f"LLM response cache tier '{backend_name}' unavailable, using memory only. Reason: {e}")
+    return ResponseCache(ttl=ttl, max_entries=int(_setting("LLM_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)), backend=backend)
+
+def memoized_stream(provider, request, open_stream, on_hit=None):
+    """
+    Yields the cached response for this request as a single delta, or streams
+    open_stream() and caches the joined text once the stream completes. Streams that
+    fail or are cancelled part-way are never cached.
+    """
+    if is_bypassed():
+        yield from open_stream()
+        return
+    cache = get_response_cache()
+    key = request_key(provider, request)
+    cached = cache.get(key)
+    if cached is not None:
+        if on_hit: on_hit()
+        yield cached
+        return
+    parts = []
+    for text in open_stream():
+        parts.append(text)
+        yield text
+    cache.put(key, "".join(parts))
@@ -0,0 +1,296 @@
+# services/llm_gateway.py
+
+import json
+import time
+import random
+import queue
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st
+from services import llm_metrics, llm_cache
+
+# --- CONFIGURATION ---
+CONNECT_TIMEOUT_SECONDS = 10
+SHORT_CALL_TIMEOUT_SECONDS = 30     # Calls capped at SHORT_CALL_MAX_TOKENS output tokens
+LONG_CALL_TIMEOUT_SECONDS = 120     # Longest silence tolerated between streamed chunks
+SHORT_CALL_MAX_TOKENS = 1024
+MAX_RETRIES = 4
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}    # 529: Anthropic "overloaded"
+MAX_CONNECTIONS = 20
+HEDGE_DEFAULT_DELAY_SECONDS = 4.0   # Used until enough latencies are observed for a call
+HEDGE_MIN_DELAY_SECONDS = 1.0
+HEDGE_MIN_SAMPLES = 20
+HEDGE_LATENCY_SAMPLES = 200
+
+# --- Provider adapters ---
+class AnthropicAdapter:
+    name = "Claude"
+    secret_name = "ANTHROPIC_API_KEY"
+
+    def __init__(self, api_key, http_client):
+        import anthropic
+        # Retries are handled by the gateway so that they are uniform across providers.
+        self.client = anthropic.Anthropic(api_key=api_key, http_client=http_client, max_retries=0)
+        self.connection_errors = (anthropic.APIConnectionError,)
+
+    def build_request(self, model, prompt=None, messages=None, system=None, max_tokens=4096, json_mode=False):
+        if prompt is not None:
+            messages = [{"role": "user", "content": self._user_content(prompt)}]
+        request = dict(model=model, max_tokens=max_tokens, temperature=0.0, messages=messages)
+        if system: request["system"] = system
+        return request
+
+    @staticmethod
+    def _user_content(prompt):
+        if isinstance(prompt, str):
+            return prompt
+        # A (stable prefix, variable suffix) pair: the prefix ends in a prompt-cache breakpoint,
+        # so repeat calls sharing it (e.g. every file of one code generation run) read it from
+        # Anthropic's cache. Prefixes below the model's minimum cacheable length are processed uncached.
+        prefix, suffix = prompt
+        return [
+            {"type": "text", "text": prefix, "cache_control": {"type": "ephemeral"}},
+            {"type": "text", "text": suffix}
+        ]
+
+    def stream(self, request, timer, timeout):
+        # Leaving the with-block (including when the consumer stops early) closes the connection.
+        with self.client.messages.stream(**request, timeout=timeout) as stream:
+            yield from stream.text_stream
+            self._record_usage(stream.get_final_message().usage, timer)
+
+    @staticmethod
+    def _record_usage(usage, timer):
+        timer.input_tokens, timer.output_tokens = usage.input_tokens, usage.output_tokens
+        timer.cache_read_tokens = usage.cache_read_input_tokens or 0
+        timer.cache_write_tokens = usage.cache_creation_input_tokens or 0
+
+class OpenAIAdapter:
+    name = "OpenAI"
+    secret_name = "OPENAI_API_KEY"
+
+    def __init__(self, api_key, http_client):
+        import openai
+        self.client = openai.OpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+        self.connection_errors = (openai.APIConnectionError,)
+
+    def build_request(self, model, prompt=None, messages=None, system=None, max_tokens=4096, json_mode=False):
+        if prompt is not None:
+            # OpenAI caches long identical prefixes automatically, so the pair is simply joined.
+            messages = [{"role": "user", "content": prompt if isinstance(prompt, str) else "".join(prompt)}]
+        if system:
+            messages = [{"role": "system", "content": system}] + list(messages)
+        request = dict(model=model, messages=messages)
+        if json_mode: request["response_format"] = {"type": "json_object"}
+        return request
+
+    def stream(self, request, timer, timeout):
+        stream = self.client.chat.completions.create(**request, stream=True, stream_options={"include_usage": True}, timeout=timeout)
+        # Closing the stream (including when the consumer stops early) drops the connection.
+        with stream:
+            for chunk in stream:
+                if chunk.usage:
+                    self._record_usage(chunk.usage, timer)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+    @staticmethod
+    def _record_usage(usage, timer):
+        # OpenAI only reports cache reads, which prompt_tokens includes; split them out
+        # to match Anthropic's accounting.
+        details = usage.prompt_tokens_details
+        timer.cache_read_tokens = (details.cached_tokens or 0) if details else 0
+        timer.input_tokens = usage.prompt_tokens - timer.cache_read_tokens
+        timer.output_tokens = usage.completion_tokens
+
+ADAPTERS = {adapter.name: adapter for adapter in (AnthropicAdapter, OpenAIAdapter)}
+
+@st.cache_resource(show_spinner=False)
+def _get_http_client():
+    """One keep-alive connection pool per process, shared by every provider and session."""
+    import httpx
+    limits = httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS)
+    timeout = httpx.Timeout(LONG_CALL_TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS)
+    return httpx.Client(limits=limits, timeout=timeout)
+
+@st.cache_resource(show_spinner=False)
+def get_adapter(provider):
+    adapter_class = ADAPTERS[provider]
+    return adapter_class(st.secrets[adapter_class.secret_name], _get_http_client())
+
+def is_configured(provider):
+    try:
+        return bool(st.secrets.get(ADAPTERS[provider].secret_name))
+    except Exception:
+        return False
+
+# --- Retries ---
+def _is_retryable(adapter, error):
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS_CODES or isinstance(error, adapter.connection_errors)
+
+def _retry_after_seconds(error):
+    response = getattr(error, "response", None)
+    headers = response.headers if response is not None else {}
+    if headers.get("retry-after-ms"):
+        try: return float(headers["retry-after-ms"]) / 1000
+        except ValueError: pass
+    if headers.get("retry-after"):
+        try: return float(headers["retry-after"])
+        except ValueError:
+            try: return max(0.0, parsedate_to_datetime(headers["retry-after"]).timestamp() - time.time())
+            except (TypeError, ValueError): pass
+    return None
+
+def _backoff_seconds(attempt, error):
+    """The server's retry-after when given, else full-jitter exponential backoff."""
+    retry_after = _retry_after_seconds(error)
+    if retry_after is not None:
+        return min(retry_after, BACKOFF_MAX_SECONDS)
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+def _retrying_stream(adapter, request, timer, timeout):
+    """
+    Retries transient failures (429/529/5xx, timeouts, dropped connections) until the
+    first delta arrives. Once text has been handed to the caller a failure is raised,
+    since replaying the stream would duplicate output.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        deltas = adapter.stream(request, timer, timeout)
+        try:
+            first = next(deltas)
+        except StopIteration:
+            return
+        except Exception as e:
+            if attempt == MAX_RETRIES or not _is_retryable(adapter, e):
+                raise
+            time.sleep(_backoff_seconds(attempt, e))
+            continue
+        yield first
+        yield from deltas
+        return
+
+# --- Hedging ---
+_hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm-hedge")
+_latency_lock = threading.Lock()
+_call_latencies = {}    # (provider, call) -> recent successful latencies in seconds
+
+def _hedge_delay(key):
+    with _latency_lock:
+        samples = sorted(_call_latencies.get(key, ()))
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_DELAY_SECONDS
+    return max(HEDGE_MIN_DELAY_SECONDS, samples[int(len(samples) * 0.95) - 1])
+
+def _record_latency(key, seconds):
+    with _latency_lock:
+        _call_latencies.setdefault(key, deque(maxlen=HEDGE_LATENCY_SAMPLES)).append(seconds)
+
+def _hedged_completion(key, open_attempt):
+    """
+    Races open_attempt() against one duplicate, started if it hasn't finished by the call's
+    observed p95 latency; the first success is returned and the other attempt stops at its
+    next delta. The primary runs on its own thread and only duplicates use the hedge pool,
+    so a burst of calls can't queue primaries behind each other. Only used for short calls,
+    where the duplicate's cost is small and bounded.
+    """
+    outcomes, settled = queue.Queue(), threading.Event()
+
+    def attempt():
+        started, parts = time.perf_counter(), []
+        deltas = open_attempt()
+        try:
+            for text in deltas:
+                if settled.is_set():
+                    deltas.close()    # The other attempt won; closing drops the connection.
+                    return
+                parts.append(text)
+        except Exception as e:
+            outcomes.put((False, e))
+            return
+        _record_latency(key, time.perf_counter() - started)
+        outcomes.put((True, "".join(parts)))
+
+    threading.Thread(target=attempt, name="llm-primary", daemon=True).start()
+    running, errors = 1, []
+    try:
+        ok, result = outcomes.get(timeout=_hedge_delay(key))
+    except queue.Empty:
+        _hedge_pool.submit(attempt)
+        running += 1
+        ok, result = outcomes.get()
+    while not ok:
+        errors.append(result)
+        running -= 1
+        if not running:
+            raise errors[0]
+        ok, result = outcomes.get()
+    settled.set()
+    yield result
+
+def _timeout(seconds):
+    import httpx    # Already loaded by the adapters; deferred so importing the gateway stays cheap.
+    return httpx.Timeout(seconds, connect=CONNECT_TIMEOUT_SECONDS)
+
+# --- Public interface ---
+def stream(provider, call, model, prompt=None, messages=None, system=None, max_tokens=4096, json_mode=False, timeout=None, hedge=False):
+    """
+    Streams a completion as text deltas. prompt is a string or a (cacheable prefix, suffix)
+    pair; messages is a full chat history instead. Every model call in the app goes
+    through here, so they all share the connection pool, retries, timeouts, response
+    memoization (llm_cache) and latency metrics (llm_metrics). With hedge=True, a short
+    call is raced against a duplicate once it runs slow and returned as a single delta.
+    """
+    adapter = get_adapter(provider)
+    request = adapter.build_request(model, prompt=prompt, messages=messages, system=system, max_tokens=max_tokens, json_mode=json_mode)
+    if timeout is None:
+        timeout = SHORT_CALL_TIMEOUT_SECONDS if max_tokens <= SHORT_CALL_MAX_TOKENS else LONG_CALL_TIMEOUT_SECONDS
+    timeout = _timeout(timeout)
+    timer = llm_metrics.StreamTimer(provider, call, model)
+
+    def open_stream():
+        if hedge and max_tokens <= SHORT_CALL_MAX_TOKENS:
+            return _hedged_completion((provider, call), lambda: _retrying_stream(adapter, request, timer, timeout))
+        return _retrying_stream(adapter, request, timer, timeout)
+
+    return llm_metrics.timed_stream(timer, llm_cache.memoized_stream(provider, request, open_stream, on_hit=timer.mark_memoized))
+
+def complete(provider, call, model, **kwargs):
+    """The full text of stream(...)."""
+    return "".join(stream(provider, call, model, **kwargs))
+
+def guarded_stream(deltas, error_message, fallback_text):
+    """Reports a failure with st.error; yields fallback_text only if nothing was streamed yet."""
+    streamed_any = False
+    try:
+        for text in deltas:
+            streamed_any = True
+            yield text
+    except Exception as e:
+        st.error(f"{error_message}: {e}")
+        if not streamed_any: yield fallback_text
+
+# --- Response helpers ---
+def strip_code_fences(text):
+    """Removes a leading ```lang line and a trailing ``` from a model response."""
+    text = text.strip()
+    if text.startswith("```"):
+        first_newline = text.find("\n")
+        text = text[first_newline + 1:] if first_newline != -1 else ""
+        if text.rstrip().endswith("```"):
+            text = text.rstrip()[:-3]
+    return text.strip()
+
+def parse_json_response(text):
+    """Parses a JSON object from a model response, tolerating code fences or prose around it."""
+    text = strip_code_fences(text)
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        start, end = text.find("{"), text.rfind("}")
+        if start == -1 or end <= start:
+            raise
+        return json.loads(text[start:end + 1])
@@ -0,0 +1,92 @@
+# services/llm_metrics.py
+
+import time
+import contextvars
+from contextlib import contextmanager
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+MAX_RECORDED_CALLS = 50
+USAGE_FIELDS = ("input_tokens", "cache_read_tokens", "cache_write_tokens", "output_tokens")
+
+_usage_totals = contextvars.ContextVar("llm_usage_totals", default=None)
+
+@contextmanager
+def usage_scope():
+    """
+    Totals the token usage of every LLM call that finishes inside the block, in this
+    thread (or asyncio task). Yields the totals dict, which is updated in place.
+    """
+    totals = {"calls": 0, "memoized_calls": 0, **{field: 0 for field in USAGE_FIELDS}}
+    token = _usage_totals.set(totals)
+    try:
+        yield totals
+    finally:
+        _usage_totals.reset(token)
+
+class StreamTimer:
+    """
+    Times one streamed completion. Call mark_token() on every delta and finish()
+    once the stream ends (or is cancelled); the numbers land in
+    st.session_state.llm_metrics for the debug panel.
+    """
+
+    def __init__(self, provider, call, model):
+        self.provider, self.call, self.model = provider, call, model
+        self.output_tokens = None
+        self.input_tokens = self.cache_read_tokens = self.cache_write_tokens = None
+        self.memoized = False
+        self._started = time.perf_counter()
+        self._first_token = None
+
+    def mark_memoized(self):
+        self.memoized = True
+
+    def mark_token(self):
+        if self._first_token is None:
+            self._first_token = time.perf_counter()
+
+    def finish(self, completed=True):
+        total = time.perf_counter() - self._started
+        generating = total - (self._first_token - self._started) if self._first_token else None
+        entry = {
+            "provider": self.provider,
+            "call": self.call,
+            "model": self.model,
+            "first_token_s": round(self._first_token - self._started, 3) if self._first_token else None,
+            "total_s": round(total, 3),
+            "input_tokens": self.input_tokens,
+            "cache_read_tokens": self.cache_read_tokens,
+            "cache_write_tokens": self.cache_write_tokens,
+            "output_tokens": self.output_tokens,
+            "tokens_per_s": round(self.output_tokens / generating, 1) if self.output_tokens and generating else None,
+            "completed": completed,
+            "memoized": self.memoized
+        }
+        _record(entry)
+        totals = _usage_totals.get()
+        if totals is not None:
+            totals["calls"] += 1
+            totals["memoized_calls"] += int(self.memoized)
+            for field in USAGE_FIELDS:
+                totals[field] += entry[field] or 0
+        return entry
+
+def _record(entry):
+    # Outside a Streamlit script run (e.g. a CLI) there is no session to record into.
+    if get_script_run_ctx() is None:
+        return
+    metrics = st.session_state.setdefault("llm_metrics", [])
+    metrics.append(entry)
+    del metrics[:-MAX_RECORDED_CALLS]
+
+def timed_stream(timer, deltas):
+    """Passes text deltas through, timing them; records the call even if the consumer stops early."""
+    completed = False
+    try:
+        for text in deltas:
+            timer.mark_token()
+            yield text
+        completed = True
+    finally:
+        timer.finish(completed)
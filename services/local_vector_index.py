@@ -0,0 +1,203 @@
+# services/local_vector_index.py
+
+import os
+import json
+import threading
+import numpy as np
+from services.cache_common import VECTOR_DIMENSION, DEFAULT_LOCAL_INDEX_PATH
+
+# --- CONFIGURATION ---
+QUANTIZED_CHUNK_ROWS = 4096
+
+class LocalVectorIndex:
+    """
+    In-process replacement for the Pinecone index, for air-gapped and dev deployments.
+
+    Vectors are L2-normalised and stored as a float32 matrix (or int8 with a per-row
+    scale when quantize=True) in a .npy file that is memory-mapped on load, with ids
+    and metadata in a JSON sidecar. Cosine top-k is a single matrix product, so
+    queries need no network hop. Writes are buffered in memory until save().
+    """
+
+    SIDECAR_FILE = "index.json"
+
+    def __init__(self, path=DEFAULT_LOCAL_INDEX_PATH, dimension=VECTOR_DIMENSION, quantize=None):
+        self.path = path
+        self.dimension = dimension
+        self.quantize = bool(quantize)
+        self._lock = threading.RLock()
+        self._ids, self._metadata = [], []
+        self._matrix = np.zeros((0, dimension), dtype=np.int8 if quantize else np.float32)
+        self._scales = np.zeros(0, dtype=np.float32)
+        self._pending_upserts, self._pending_deletes = {}, set()
+        self._mask_cache = {}
+        self._loaded_mtime = None
+        if os.path.exists(self._sidecar_path):
+            self._load()
+            if quantize is not None and bool(quantize) != self.quantize:
+                self._set_quantized(bool(quantize))
+
+    @property
+    def _sidecar_path(self):
+        return os.path.join(self.path, self.SIDECAR_FILE)
+
+    def _load(self):
+        with open(self._sidecar_path) as f:
+            sidecar = json.load(f)
+        self.dimension, self.quantize = sidecar["dimension"], sidecar["quantized"]
+        self._ids, self._metadata = sidecar["ids"], sidecar["metadata"]
+        self._matrix = np.load(os.path.join(self.path, sidecar["matrix_file"]), mmap_mode="r")
+        self._scales = np.load(os.path.join(self.path, "scales.npy")) if self.quantize else np.zeros(0, dtype=np.float32)
+        self._mask_cache = {}
+        self._loaded_mtime = os.path.getmtime(self._sidecar_path)
+
+    def _reload_if_changed(self):
+        # Picks up a rebuild by cache_builder.py without restarting the app.
+        if self._pending_upserts or self._pending_deletes or not os.path.exists(self._sidecar_path):
+            return
+        if os.path.getmtime(self._sidecar_path) != self._loaded_mtime:
+            self._load()
+
+    # --- Pinecone-compatible interface ---
+    def upsert(self, vectors):
+        with self._lock:
+            for vector in vectors:
+                self._pending_deletes.discard(vector["id"])
+                self._pending_upserts[vector["id"]] = (vector["values"], vector.get("metadata", {}))
+
+    def delete(self, ids):
+        with self._lock:
+            for doc_id in ids:
+                self._pending_upserts.pop(doc_id, None)
+                self._pending_deletes.add(doc_id)
+
+    def query(self, vector, top_k=10, filter=None, include_metadata=True, **kwargs):
+        results = self.query_batch([vector], top_k=top_k, filter=filter, include_metadata=include_metadata)
+        return results[0]
+
+    def describe_index_stats(self):
+        with self._lock:
+            self._apply_pending()
+            return {"dimension": self.dimension, "total_vector_count": len(self._ids), "quantized": self.quantize}
+
+    # --- Local extensions ---
+    def query_batch(self, vectors, top_k=10, filter=None, include_metadata=True):
+        """
+        Cosine top-k for several query vectors at once. Returns one Pinecone-style
+        {"matches": [{"id", "score", "metadata"}]} response per query vector.
+        """
+        with self._lock:
+            self._reload_if_changed()
+            self._apply_pending()
+            queries = _normalise(np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1))
+            if not self._ids:
+                return [{"matches": []} for _ in vectors]
+
+            if self.quantize:
+                # Dequantise in row chunks so the float32 copy never has to exist all at once.
+                scores = np.concatenate([
+                    queries @ np.asarray(self._matrix[start:start + QUANTIZED_CHUNK_ROWS], dtype=np.float32).T
+                    for start in range(0, len(self._ids), QUANTIZED_CHUNK_ROWS)
+                ], axis=1) * self._scales
+            else:
+                scores = queries @ self._matrix.T
+            mask = self._filter_mask(filter)
+            if mask is not None:
+                scores = np.where(mask, scores, -np.inf)
+
+            k = min(top_k, len(self._ids))
+            top_rows = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            responses = []
+            for query_scores, rows in zip(scores, top_rows):
+                rows = rows[np.argsort(-query_scores[rows])]
+                responses.append({"matches": [
+                    {
+                        "id": self._ids[row],
+                        "score": float(query_scores[row]),
+                        "metadata": self._metadata[row] if include_metadata else None
+                    }
+                    for row in rows if np.isfinite(query_scores[row])
+                ]})
+            return responses
+
+    def save(self):
+        """Writes pending changes to disk and re-opens the matrix memory-mapped."""
+        with self._lock:
+            self._apply_pending()
+            os.makedirs(self.path, exist_ok=True)
+            matrix_file = "vectors.int8.npy" if self.quantize else "vectors.f32.npy"
+            _atomic_save_npy(os.path.join(self.path, matrix_file), np.asarray(self._matrix))
+            if self.quantize:
+                _atomic_save_npy(os.path.join(self.path, "scales.npy"), self._scales)
+            tmp_path = f"{self._sidecar_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({
+                    "dimension": self.dimension, "quantized": self.quantize, "matrix_file": matrix_file,
+                    "ids": self._ids, "metadata": self._metadata
+                }, f)
+            os.replace(tmp_path, self._sidecar_path)
+            self._load()
+
+    def _apply_pending(self):
+        if not self._pending_upserts and not self._pending_deletes:
+            return
+        keep_rows = [row for row, doc_id in enumerate(self._ids)
+                     if doc_id not in self._pending_deletes and doc_id not in self._pending_upserts]
+        new_ids = list(self._pending_upserts)
+        new_vectors = _normalise(np.asarray([self._pending_upserts[i][0] for i in new_ids], dtype=np.float32).reshape(len(new_ids), self.dimension))
+        if self.quantize:
+            new_matrix, new_scales = _quantize(new_vectors)
+            self._matrix = np.concatenate([np.asarray(self._matrix)[keep_rows], new_matrix])
+            self._scales = np.concatenate([self._scales[keep_rows], new_scales])
+        else:
+            self._matrix = np.concatenate([np.asarray(self._matrix)[keep_rows], new_vectors])
+        self._ids = [self._ids[row] for row in keep_rows] + new_ids
+        self._metadata = [self._metadata[row] for row in keep_rows] + [self._pending_upserts[i][1] for i in new_ids]
+        self._pending_upserts, self._pending_deletes = {}, set()
+        self._mask_cache = {}
+
+    def _set_quantized(self, quantize):
+        matrix = np.asarray(self._matrix, dtype=np.float32)
+        if self.quantize:
+            matrix = matrix * self._scales[:, None]
+        if quantize:
+            self._matrix, self._scales = _quantize(matrix)
+        else:
+            self._matrix, self._scales = matrix, np.zeros(0, dtype=np.float32)
+        self.quantize = quantize
+
+    def _filter_mask(self, metadata_filter):
+        if not metadata_filter:
+            return None
+        key = json.dumps(metadata_filter, sort_keys=True)
+        if key not in self._mask_cache:
+            self._mask_cache[key] = np.array([_matches_filter(m, metadata_filter) for m in self._metadata], dtype=bool)
+        return self._mask_cache[key]
+
+def _normalise(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+def _quantize(matrix):
+    """Symmetric per-row int8 quantisation: row ~= int8_row * scale."""
+    scales = np.abs(matrix).max(axis=1) / 127
+    scales = np.where(scales == 0, 1, scales).astype(np.float32)
+    return np.round(matrix / scales[:, None]).astype(np.int8), scales
+
+def _atomic_save_npy(path, array):
+    tmp_path = f"{path}.tmp.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+def _matches_filter(metadata, metadata_filter):
+    """Supports the subset of Pinecone's filter language used here: equality, $eq, $ne, $in and $nin."""
+    for field, condition in metadata_filter.items():
+        value = metadata.get(field)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, operand in condition.items():
+            if op == "$eq" and value != operand: return False
+            if op == "$ne" and value == operand: return False
+            if op == "$in" and value not in operand: return False
+            if op == "$nin" and value in operand: return False
+    return True
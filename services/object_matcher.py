@@ -0,0 +1,60 @@
+# services/object_matcher.py
+
+from collections import defaultdict
+
+NGRAM_SIZE = 3
+
+class ObjectNameMatcher:
+    """
+    Trigram index over the lowercased API names of an org's objects, built once per
+    schema cache version. A suggestion matches every object whose API name contains
+    it (case-insensitively), exactly like a substring scan, but only objects sharing
+    all of the suggestion's trigrams are ever compared. Labels don't add matches;
+    they are only used to rank the objects that did match.
+    """
+
+    def __init__(self, object_names, labels=None):
+        labels = labels or {}
+        self.names = tuple(sorted(object_names))
+        self._lower_names = [name.lower() for name in self.names]
+        self._lower_labels = [(labels.get(name) or "").lower() for name in self.names]
+        self._postings = defaultdict(set)
+        for i, lower in enumerate(self._lower_names):
+            for gram in _ngrams(lower):
+                self._postings[gram].add(i)
+
+    def match(self, suggestions):
+        """
+        Returns [(object API name, relevance)] for all objects matching any suggestion,
+        most relevant first. Relevance is in (0, 1]; 1.0 means an exact name match.
+        """
+        best = {}
+        for suggestion in {s.lower() for s in suggestions}:
+            for i in self._candidates(suggestion):
+                if suggestion in self._lower_names[i]:
+                    score = self._relevance(suggestion, i)
+                    if score > best.get(i, 0):
+                        best[i] = score
+        return sorted(((self.names[i], score) for i, score in best.items()), key=lambda item: (-item[1], item[0]))
+
+    def _candidates(self, suggestion):
+        grams = _ngrams(suggestion)
+        if not grams:
+            # Too short to index; fall back to checking every name.
+            return range(len(self.names))
+        postings = sorted((self._postings.get(gram, set()) for gram in grams), key=len)
+        return set.intersection(*postings) if postings[0] else ()
+
+    def _relevance(self, suggestion, i):
+        name, label = self._lower_names[i], self._lower_labels[i]
+        if suggestion in (name, name.removesuffix("__c")):
+            return 1.0
+        if suggestion in (label, label.replace(" ", "")):
+            return 0.95
+        coverage = len(suggestion) / len(name)
+        if name.startswith(suggestion):
+            return round(0.5 + 0.4 * coverage, 3)
+        return round(0.4 * coverage, 3)
+
+def _ngrams(text):
+    return {text[i:i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)}
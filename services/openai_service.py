@@ -1,44 +1,38 @@
 # services/openai_service.py
 
 import streamlit as st
-from openai import OpenAI
-import json
+from services import llm_gateway
 from prompts import (
-    get_triage_prompt, 
-    get_final_solution_prompt, 
-    get_technical_solution_prompt, 
-    get_single_file_code_prompt,
+    get_triage_prompt_parts,
+    get_final_solution_prompt_parts,
+    get_technical_solution_prompt_parts,
+    get_single_file_code_prompt_parts,
     get_chat_system_prompt,
+    get_conversation_summary_prompt,
     get_entity_extraction_prompt,
     get_dependency_analysis_prompt
 )
 
 # --- Initialization ---
-CLIENT_INITIALIZED = False
-try:
-    if "OPENAI_API_KEY" in st.secrets and st.secrets["OPENAI_API_KEY"]:
-        client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
-        CLIENT_INITIALIZED = True
-except Exception as e:
-    st.error(f"Failed to initialize OpenAI client. Error: {e}")
+# The OpenAI client itself lives in llm_gateway, which handles pooling, retries and timeouts.
+PROVIDER = "OpenAI"
 
 MODEL_NAME = "gpt-4o"
+MAX_CONCURRENT_REQUESTS = 6     # Parallel code-generation calls, kept under OpenAI rate limits
 
 def _is_client_configured():
-    if not CLIENT_INITIALIZED:
+    # Checked per call rather than at import, so importing the service never touches st.secrets.
+    if not llm_gateway.is_configured(PROVIDER):
         st.error("OpenAI API key not found. Please add it to your secrets.")
-    return CLIENT_INITIALIZED
+        return False
+    return True
 
 def extract_entities_from_story(user_story):
     if not _is_client_configured(): return []
     prompt = get_entity_extraction_prompt(user_story)
     try:
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"}
-        )
-        response_data = json.loads(response.choices[0].message.content)
+        response_text = llm_gateway.complete(PROVIDER, "entity_extraction", MODEL_NAME, prompt=prompt, max_tokens=1024, json_mode=True, hedge=True)
+        response_data = llm_gateway.parse_json_response(response_text)
         return response_data.get("objects", [])
     except Exception as e:
         st.error(f"An error occurred during entity extraction with OpenAI: {e}")
@@ -46,80 +40,72 @@ def extract_entities_from_story(user_story):
 
 def analyze_story(user_story, schema_context):
     if not _is_client_configured(): return None
-    prompt = get_triage_prompt(user_story, schema_context)
     try:
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"}
-        )
-        return json.loads(response.choices[0].message.content)
+        response_text = llm_gateway.complete(PROVIDER, "triage", MODEL_NAME, prompt=get_triage_prompt_parts(user_story, schema_context), max_tokens=2048, json_mode=True)
+        return llm_gateway.parse_json_response(response_text)
     except Exception as e:
         st.error(f"An error occurred during story analysis with OpenAI: {e}"); return None
 
-def generate_solution_with_answers(user_story, context_from_answers, schema_context):
-    if not _is_client_configured(): return "Error: OpenAI client not initialized."
-    prompt = get_final_solution_prompt(user_story, context_from_answers, schema_context)
-    response = client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=[{"role": "user", "content": prompt}]
+def stream_solution_with_answers(user_story, context_from_answers, schema_context):
+    if not _is_client_configured(): yield "Error: OpenAI client not initialized."; return
+    yield from llm_gateway.guarded_stream(
+        llm_gateway.stream(PROVIDER, "solution_with_answers", MODEL_NAME, prompt=get_final_solution_prompt_parts(user_story, context_from_answers, schema_context)),
+        "An error occurred with the OpenAI API", "Sorry, an error occurred with the AI."
     )
-    return response.choices[0].message.content
-
-def generate_technical_solution(user_story, solution_overview, schema_context):
-    if not _is_client_configured(): return "Error: OpenAI client not initialized."
-    prompt = get_technical_solution_prompt(user_story, solution_overview, schema_context)
-    response = client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=[{"role": "user", "content": prompt}]
+
+def generate_solution_with_answers(user_story, context_from_answers, schema_context):
+    return "".join(stream_solution_with_answers(user_story, context_from_answers, schema_context))
+
+def stream_technical_solution(user_story, solution_overview, schema_context):
+    if not _is_client_configured(): yield "Error: OpenAI client not initialized."; return
+    yield from llm_gateway.guarded_stream(
+        llm_gateway.stream(PROVIDER, "technical_solution", MODEL_NAME, prompt=get_technical_solution_prompt_parts(user_story, solution_overview, schema_context)),
+        "An error occurred with the OpenAI API", "Sorry, an error occurred with the AI."
     )
-    return response.choices[0].message.content
+
+def generate_technical_solution(user_story, solution_overview, schema_context, raise_errors=False):
+    """With raise_errors, a failed or truncated generation raises instead of returning an error or partial text (for headless callers)."""
+    if not raise_errors:
+        return "".join(stream_technical_solution(user_story, solution_overview, schema_context))
+    if not llm_gateway.is_configured(PROVIDER): raise RuntimeError("OpenAI client not initialized.")
+    return llm_gateway.complete(PROVIDER, "technical_solution", MODEL_NAME, prompt=get_technical_solution_prompt_parts(user_story, solution_overview, schema_context))
 
 def get_generation_order(filenames):
     if not _is_client_configured(): return filenames
     prompt = get_dependency_analysis_prompt(filenames)
     try:
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"}
-        )
-        response_data = json.loads(response.choices[0].message.content)
+        response_text = llm_gateway.complete(PROVIDER, "generation_order", MODEL_NAME, prompt=prompt, max_tokens=1024, json_mode=True, hedge=True)
+        response_data = llm_gateway.parse_json_response(response_text)
         return response_data.get("generation_order", filenames)
     except Exception as e:
         st.warning(f"Could not determine file dependencies with OpenAI, using default order. Reason: {e}")
         return filenames
 
-def generate_single_file_code(full_context, file_name):
+def stream_single_file_code(full_context, file_name, dependency_code=None):
+    """Raw deltas of the file's code; the caller strips any markdown fence once complete."""
+    if not _is_client_configured(): return
+    yield from llm_gateway.stream(PROVIDER, "single_file_code", MODEL_NAME, prompt=get_single_file_code_prompt_parts(full_context, file_name, dependency_code))
+
+def generate_single_file_code(full_context, file_name, dependency_code=None):
     if not _is_client_configured(): return None
-    prompt = get_single_file_code_prompt(full_context, file_name)
     try:
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        response_text = response.choices[0].message.content.strip()
         # Clean up markdown code blocks if the AI includes them
-        if response_text.startswith("```"):
-            first_newline = response_text.find('\n')
-            if first_newline != -1:
-                response_text = response_text[first_newline+1:]
-            if response_text.endswith("```"):
-                response_text = response_text[:-3]
-        return response_text.strip()
+        return llm_gateway.strip_code_fences("".join(stream_single_file_code(full_context, file_name, dependency_code)))
     except Exception as e:
         st.error(f"An error occurred during code generation with OpenAI: {e}")
         return f"// Error generating code for {file_name}: {e}"
 
-def get_chat_response(messages):
-    if not _is_client_configured(): return "Error: OpenAI client not initialized."
-    system_prompt = {"role": "system", "content": get_chat_system_prompt()}
-    try:
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[system_prompt] + messages
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        st.error(f"An error occurred with the OpenAI API: {e}")
-        return "Sorry, I encountered an error. Please try again."
\ No newline at end of file
+def stream_chat_response(messages, conversation_summary=None):
+    if not _is_client_configured(): yield "Error: OpenAI client not initialized."; return
+    yield from llm_gateway.guarded_stream(
+        llm_gateway.stream(PROVIDER, "chat", MODEL_NAME, messages=messages, system=get_chat_system_prompt(conversation_summary)),
+        "An error occurred with the OpenAI API", "Sorry, I encountered an error. Please try again."
+    )
+
+def get_chat_response(messages, conversation_summary=None):
+    return "".join(stream_chat_response(messages, conversation_summary))
+
+def summarize_conversation(previous_summary, messages):
+    """Folds older chat messages into the running summary. Runs in the background, so it raises instead of using st.error."""
+    if not llm_gateway.is_configured(PROVIDER): raise RuntimeError("OpenAI client not initialized.")
+    return llm_gateway.complete(PROVIDER, "chat_summary", MODEL_NAME, prompt=get_conversation_summary_prompt(previous_summary, messages), max_tokens=1024).strip()
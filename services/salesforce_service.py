@@ -1,28 +1,143 @@
 # services/salesforce_service.py
 
 import streamlit as st
-from simple_salesforce import Salesforce, SalesforceGeneralError
 import re
-import redis
 import json
+import time
+import threading
+from collections import deque
+from cachetools import LRUCache, TTLCache
+from services.object_matcher import ObjectNameMatcher
+from services import vector_store, tokenizer
+# The schema cache layout is shared with cache_builder.py, which writes the cache.
+from services.cache_common import SCHEMA_VERSION_KEY, ALL_OBJECT_NAMES_KEY, OBJECT_LABELS_KEY, schema_key
 
-def connect_to_salesforce(username, consumer_key, private_key):
+# --- Redis Connection Pool ---
+REDIS_LATENCY_SAMPLES = 500     # Most recent calls kept per operation for latency percentiles
+_redis_latencies = {}
+_redis_latencies_lock = threading.Lock()
+
+@st.cache_resource(show_spinner=False)
+def get_redis_client():
     """
-    Connects to Salesforce using JWT Bearer Flow with provided credentials.
-    This is used by the offline cache_builder.py script.
+    Returns the process-wide Redis client for the schema cache. It is backed by a
+    single TLS connection pool shared by every Streamlit session, so requests reuse
+    warm connections instead of paying for a new handshake each time. Idle
+    connections are health-checked before reuse rather than pinging on every call.
     """
-    if not all([username, consumer_key, private_key]):
-        print("ERROR: Salesforce credentials were not provided.")
-        return None
+    import redis
+    pool = redis.BlockingConnectionPool(
+        connection_class=redis.SSLConnection,
+        host=st.secrets["REDIS_HOST"], port=int(st.secrets["REDIS_PORT"]),
+        username=st.secrets["REDIS_USERNAME"], password=st.secrets["REDIS_PASSWORD"],
+        ssl_cert_reqs="required", decode_responses=True,
+        max_connections=int(st.secrets.get("REDIS_POOL_SIZE", 10)),
+        timeout=float(st.secrets.get("REDIS_POOL_TIMEOUT", 5)),
+        socket_timeout=float(st.secrets.get("REDIS_SOCKET_TIMEOUT", 5)),
+        socket_connect_timeout=float(st.secrets.get("REDIS_CONNECT_TIMEOUT", 5)),
+        health_check_interval=int(st.secrets.get("REDIS_HEALTH_CHECK_INTERVAL", 30))
+    )
+    return redis.Redis(connection_pool=pool)
+
+def _timed_redis_call(operation, func, *args):
+    started = time.perf_counter()
     try:
-        return Salesforce(
-            username=username,
-            consumer_key=consumer_key,
-            privatekey=private_key
-        )
-    except Exception as e:
-        print(f"ERROR: Failed to connect to Salesforce: {e}")
+        return func(*args)
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with _redis_latencies_lock:
+            _redis_latencies.setdefault(operation, deque(maxlen=REDIS_LATENCY_SAMPLES)).append(elapsed_ms)
+
+def get_redis_latency_stats():
+    """
+    Returns per-operation latency percentiles (ms) for recent schema cache calls in this process.
+    """
+    stats = {}
+    with _redis_latencies_lock:
+        samples_by_operation = {op: sorted(samples) for op, samples in _redis_latencies.items()}
+    for operation, samples in samples_by_operation.items():
+        stats[operation] = {
+            "calls": len(samples),
+            "p50_ms": round(samples[len(samples) // 2], 2),
+            "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2),
+            "max_ms": round(samples[-1], 2)
+        }
+    return stats
+
+# --- In-Process Schema Cache ---
+# Parsed object lists and field lists are kept in memory per cache version. Only the
+# version pointer is re-read from Redis (at most once per SCHEMA_VERSION_TTL_SECONDS),
+# so repeated analyses cost no Redis traffic until cache_builder publishes a new version.
+SCHEMA_VERSION_TTL_SECONDS = 60
+_schema_cache_lock = threading.Lock()
+_schema_version_cache = TTLCache(maxsize=1, ttl=SCHEMA_VERSION_TTL_SECONDS)
+_object_matcher_cache = LRUCache(maxsize=4)        # version -> ObjectNameMatcher
+_object_fields_cache = LRUCache(maxsize=5000)      # (version, object name) -> createable fields
+
+def _get_schema_version(redis_client):
+    with _schema_cache_lock:
+        if "version" in _schema_version_cache:
+            return _schema_version_cache["version"]
+    version = _timed_redis_call("get", redis_client.get, SCHEMA_VERSION_KEY)
+    with _schema_cache_lock:
+        _schema_version_cache["version"] = version
+    return version
+
+def _get_object_matcher(redis_client, version):
+    """
+    Returns the ObjectNameMatcher for the given cache version, or None if the master
+    list is missing. Unversioned (legacy) caches are never held in memory because
+    nothing would tell us when they change.
+    """
+    with _schema_cache_lock:
+        if version and version in _object_matcher_cache:
+            return _object_matcher_cache[version]
+    master_list_json, labels_json = _timed_redis_call(
+        "mget", redis_client.mget, [schema_key(version, ALL_OBJECT_NAMES_KEY), schema_key(version, OBJECT_LABELS_KEY)]
+    )
+    if not master_list_json:
         return None
+    matcher = ObjectNameMatcher(json.loads(master_list_json), json.loads(labels_json) if labels_json else None)
+    if version:
+        with _schema_cache_lock:
+            _object_matcher_cache[version] = matcher
+    return matcher
+
+def _get_object_fields(redis_client, version, object_names):
+    """
+    Returns {object name: [createable field dicts]} for the objects found in the cache,
+    fetching only the objects not already parsed in memory with a single MGET.
+    """
+    fields_by_object, to_fetch = {}, []
+    with _schema_cache_lock:
+        for name in object_names:
+            if version and (version, name) in _object_fields_cache:
+                fields_by_object[name] = _object_fields_cache[(version, name)]
+            else:
+                to_fetch.append(name)
+    if to_fetch:
+        cached_data_list = _timed_redis_call("mget", redis_client.mget, [schema_key(version, f"sobject:{name}") for name in to_fetch])
+        for name, cached_data in zip(to_fetch, cached_data_list):
+            # Objects missing from Redis are remembered as None so they aren't requested again.
+            fields = [
+                {"name": field['name'], "type": str(field['type'])}
+                for field in json.loads(cached_data) if field.get('createable')
+            ] if cached_data else None
+            fields_by_object[name] = fields
+            if version:
+                with _schema_cache_lock:
+                    _object_fields_cache[(version, name)] = fields
+    return {name: fields for name, fields in fields_by_object.items() if fields is not None}
+
+# --- Schema Context Budget ---
+SCHEMA_CONTEXT_TOKEN_BUDGET = 6000
+SCHEMA_MAX_FIELDS_PER_OBJECT = 60
+SCHEMA_MIN_FIELDS_PER_OBJECT = 5    # An object is left out rather than listed with fewer fields
+
+# --- Semantic Schema Retrieval ---
+SEMANTIC_TOP_K_OBJECTS = 12
+SEMANTIC_TOP_K_CODE = 5
+SEMANTIC_MIN_SCORE = 0.2        # Cosine similarity below which a match is treated as noise
 
 def extract_sfdc_objects_by_keyword(text):
     """
@@ -37,64 +152,218 @@ def extract_sfdc_objects_by_keyword(text):
     common_words_to_filter = {"As", "I", "When", "The", "A", "If", "But", "Only", "However"}
     return sorted(list(set(obj for obj in potential_objects if obj not in common_words_to_filter)))
 
-def get_org_schema_for_objects(object_names_from_ai):
+def get_org_schema_for_objects(object_names_from_ai, redis_client=None):
     """
     Performs a case-insensitive "Fetch and Filter" against the Redis cache
-    to get the schema for a given list of object names.
+    to get the schema for a given list of object names. redis_client defaults
+    to the shared pooled client; benchmarks can pass a local stand-in.
     """
     if not object_names_from_ai:
         return "No objects were identified to fetch schema for.", {}
 
     debug_data = {}
     try:
-        redis_client = redis.Redis(
-            host=st.secrets["REDIS_HOST"], port=int(st.secrets["REDIS_PORT"]),
-            username=st.secrets["REDIS_USERNAME"], password=st.secrets["REDIS_PASSWORD"],
-            ssl=True, ssl_cert_reqs="required", decode_responses=True
-        )
-        redis_client.ping()
+        redis_client = redis_client or get_redis_client()
+        # 1. Fetch the master list of all object names from the current cache version.
+        version = _get_schema_version(redis_client)
+        matcher = _get_object_matcher(redis_client, version)
     except Exception as e:
         st.error(f"Could not connect to Redis cache. Error: {e}")
         return "Error: Could not connect to metadata cache.", debug_data
-    
-    # 1. Fetch the master list of all object names from the cache.
-    master_list_json = redis_client.get("sfdc:all_object_names")
-    if not master_list_json:
+
+    if not matcher:
         st.warning("Master object list not found in cache.")
         debug_data["2_Master_Object_List_from_Cache"] = "ERROR: Not Found"
         return "Error: Master object list not found.", debug_data
     
-    all_valid_object_names = set(json.loads(master_list_json))
-    debug_data["2_Master_Object_List_from_Cache"] = sorted(list(all_valid_object_names))
+    debug_data["2_Master_Object_List_from_Cache"] = list(matcher.names)
     
-    # 2. Find all actual objects that match the AI's suggestions, case-insensitively.
-    matching_object_api_names = set()
-    for suggestion in object_names_from_ai:
-        suggestion_lower = suggestion.lower()
-        for actual_object in all_valid_object_names:
-            if suggestion_lower in actual_object.lower():
-                matching_object_api_names.add(actual_object)
-
-    debug_data["3_Matched_Objects_After_Filtering"] = sorted(list(matching_object_api_names))
+    # 2. Find all actual objects that match the AI's suggestions, case-insensitively,
+    #    ranked by relevance so that the weakest over-matches can be cut.
+    ranked_matches = matcher.match(object_names_from_ai)
+    max_objects = int(st.secrets.get("SCHEMA_MAX_MATCHED_OBJECTS", 0))
+    if max_objects and len(ranked_matches) > max_objects:
+        debug_data["3b_Objects_Cut_As_Weak_Matches"] = [name for name, _ in ranked_matches[max_objects:]]
+        ranked_matches = ranked_matches[:max_objects]
+    matching_object_api_names = [name for name, _ in ranked_matches]
+
+    debug_data["3_Matched_Objects_After_Filtering"] = sorted(matching_object_api_names)
+    debug_data["3a_Match_Relevance"] = dict(ranked_matches)
     
     if not matching_object_api_names:
         st.warning(f"No matching schemas found in cache for AI-suggested terms: {', '.join(object_names_from_ai)}.")
         debug_data["4_Final_Schema_Context"] = "None"
         return "Could not retrieve schema from the cache.", debug_data
 
-    # 3. Retrieve all schemas in one go.
-    redis_keys_to_fetch = [f"sobject:{name}" for name in matching_object_api_names]
-    schema_details = []
-    cached_data_list = redis_client.mget(redis_keys_to_fetch)
-
-    for key, cached_data in zip(redis_keys_to_fetch, cached_data_list):
-        if cached_data:
-            obj_name_from_key = key.split(":")[-1]
-            fields_data = json.loads(cached_data)
-            fields = [f"{field['name']} ({str(field['type'])})" for field in fields_data if field.get('createable')]
-            schema_details.append(f"Object: {obj_name_from_key}\nFields: {', '.join(fields)}")
-            
+    # 3. Retrieve all schemas in one go (objects already parsed in memory are not re-fetched).
+    final_schema_string = _build_schema_context(redis_client, version, matching_object_api_names, debug_data)
+    if final_schema_string is None:
+        return "Error: Could not read from metadata cache.", debug_data
+    return final_schema_string, debug_data
+
+def get_schema_cache_version():
+    """
+    The published schema cache version (re-read at most every SCHEMA_VERSION_TTL_SECONDS),
+    or None for an unversioned cache or when Redis can't be reached. Never raises.
+    """
+    try:
+        return _get_schema_version(get_redis_client())
+    except Exception:
+        return None
+
+def prefetch_object_schemas(object_names):
+    """
+    Warms the in-process schema caches for the objects matching object_names, so that a
+    following get_org_schema_for_objects() only fetches the objects it adds. Meant to run
+    in the background while the AI extracts entities; returns the prefetched object
+    names and never raises (the foreground lookup reports any Redis problem).
+    Unversioned caches are never held in memory, so there is nothing to prefetch into.
+    """
+    try:
+        redis_client = get_redis_client()
+        version = _get_schema_version(redis_client)
+        matcher = _get_object_matcher(redis_client, version) if version else None
+        if not matcher or not object_names:
+            return []
+        names = [name for name, _ in matcher.match(object_names)]
+        max_objects = int(st.secrets.get("SCHEMA_MAX_MATCHED_OBJECTS", 0))
+        if max_objects:
+            names = names[:max_objects]
+        _get_object_fields(redis_client, version, names)
+        return names
+    except Exception:
+        return []
+
+def _build_schema_context(redis_client, version, object_names, debug_data):
+    """
+    Formats the createable fields of the given objects as the schema context string
+    passed to the prompts. Objects are taken in the given (relevance) order, each with
+    at most SCHEMA_MAX_FIELDS_PER_OBJECT fields, until SCHEMA_CONTEXT_TOKEN_BUDGET tokens
+    are used, so the prompt stays bounded however many objects matched.
+    Returns None if Redis fails.
+    """
+    object_names = list(dict.fromkeys(object_names))
+    try:
+        fields_by_object = _get_object_fields(redis_client, version, object_names)
+    except Exception as e:
+        st.error(f"Could not read schemas from Redis cache. Error: {e}")
+        return None
+
+    token_budget = int(st.secrets.get("SCHEMA_CONTEXT_TOKEN_BUDGET", SCHEMA_CONTEXT_TOKEN_BUDGET))
+    max_fields = int(st.secrets.get("SCHEMA_MAX_FIELDS_PER_OBJECT", SCHEMA_MAX_FIELDS_PER_OBJECT))
+    schema_details, tokens_used, omitted, truncated = [], 0, [], {}
+    for obj_name in object_names:
+        if obj_name not in fields_by_object:
+            continue
+        if tokens_used >= token_budget:
+            omitted.append(obj_name)
+            continue
+        fields = _prioritised_fields(fields_by_object[obj_name])
+        block, shown = _fit_object_block(obj_name, fields, max_fields, token_budget - tokens_used)
+        if block is None:
+            omitted.append(obj_name)
+            continue
+        if shown < len(fields):
+            truncated[obj_name] = f"{shown}/{len(fields)} fields"
+        schema_details.append(block)
+        tokens_used += tokenizer.count_tokens(block) + 1
+
     final_schema_string = "\n\n".join(schema_details)
     debug_data["4_Final_Schema_Context"] = final_schema_string
-    
-    return final_schema_string, debug_data
\ No newline at end of file
+    debug_data["4a_Schema_Context_Tokens"] = {"used": tokens_used, "budget": token_budget, "tokenizer": tokenizer.describe()}
+    if truncated:
+        debug_data["4b_Objects_With_Truncated_Fields"] = truncated
+    if omitted:
+        debug_data["4c_Objects_Omitted_For_Token_Budget"] = omitted
+    debug_data["Redis_Latency"] = get_redis_latency_stats()
+    debug_data["Schema_Cache_Version"] = version or "unversioned"
+    return final_schema_string
+
+def _prioritised_fields(fields):
+    """Custom fields first (the model can't know them), then the rest; duplicates dropped."""
+    unique = list({field["name"]: field for field in fields}.values())
+    return sorted(unique, key=lambda field: not field["name"].endswith("__c"))
+
+def _fit_object_block(obj_name, fields, max_fields, tokens_left):
+    """
+    Renders an object's block with as many of its fields (up to max_fields) as fit in
+    tokens_left. Returns (block, number of fields shown), or (None, 0) if even a
+    minimal block doesn't fit.
+    """
+    def render(count):
+        listed = ", ".join(f"{field['name']} ({field['type']})" for field in fields[:count])
+        more = f", ... (+{len(fields) - count} more)" if count < len(fields) else ""
+        return f"Object: {obj_name}\nFields: {listed}{more}"
+
+    count = min(len(fields), max_fields)
+    block = render(count)
+    if tokenizer.count_tokens(block) <= tokens_left:
+        return block, count
+    low, high = 0, count    # Largest field count that fits, by bisection.
+    while low < high:
+        mid = (low + high + 1) // 2
+        if tokenizer.count_tokens(render(mid)) <= tokens_left: low = mid
+        else: high = mid - 1
+    if low < min(len(fields), SCHEMA_MIN_FIELDS_PER_OBJECT):
+        return None, 0
+    return render(low), low
+
+def is_semantic_retrieval_enabled():
+    """
+    Semantic retrieval needs the metadata index (Pinecone, or a local index) and an
+    embeddings key; it can also be switched off with SCHEMA_RETRIEVAL = "keyword" in secrets.
+    """
+    has_index = vector_store.is_local_store_configured(st.secrets) or bool(st.secrets.get("PINECONE_API_KEY"))
+    return (
+        st.secrets.get("SCHEMA_RETRIEVAL", "semantic") == "semantic"
+        and has_index and bool(st.secrets.get("OPENAI_API_KEY"))
+    )
+
+def get_schema_context_from_vectors(user_story, index=None, embed=None):
+    """
+    Builds the schema context by semantic search instead of entity extraction: the story
+    is embedded once, the metadata index is queried for the closest SObjects (plus related
+    Apex classes and Flows), and the field lists of those objects come from the Redis cache.
+
+    index and embed default to the Pinecone index and OpenAI embeddings; tests can pass a
+    local stand-in index and a fake embedding function instead.
+    Returns (schema_context, debug_data), with schema_context None if retrieval failed or
+    found no object scoring at least SEMANTIC_MIN_SCORE.
+    """
+    debug_data = {}
+    try:
+        index = index or vector_store.get_metadata_index()
+        embed = embed or vector_store.embed_query
+        story_vector = embed(user_story)
+        object_matches = vector_store.query_metadata(index, story_vector, ["SObject"], SEMANTIC_TOP_K_OBJECTS)
+        code_matches = vector_store.query_metadata(index, story_vector, ["ApexClass", "Flow"], SEMANTIC_TOP_K_CODE)
+    except Exception as e:
+        st.warning(f"Semantic schema retrieval failed, falling back to entity extraction. Reason: {e}")
+        return None, debug_data
+
+    object_names = [name for name, _, score in object_matches if score >= SEMANTIC_MIN_SCORE]
+    debug_data["1_Semantic_Object_Matches"] = {name: round(score, 3) for name, _, score in object_matches}
+    debug_data["1b_Semantic_Code_Matches"] = {f"{kind}:{name}": round(score, 3) for name, kind, score in code_matches}
+    debug_data["3_Matched_Objects_After_Filtering"] = object_names
+    if not object_names:
+        # An empty index or only weak matches: let the caller fall back to entity extraction.
+        debug_data["4_Final_Schema_Context"] = "None"
+        return None, debug_data
+
+    try:
+        redis_client = get_redis_client()
+        version = _get_schema_version(redis_client)
+    except Exception as e:
+        st.error(f"Could not connect to Redis cache. Error: {e}")
+        return None, debug_data
+    schema_context = _build_schema_context(redis_client, version, object_names, debug_data)
+    if schema_context is None:
+        return None, debug_data
+
+    for metadata_type, heading in (("ApexClass", "Existing Apex Classes"), ("Flow", "Existing Flows")):
+        related = [name for name, kind, score in code_matches if kind == metadata_type and score >= SEMANTIC_MIN_SCORE]
+        if related:
+            schema_context += f"\n\n{heading}: {', '.join(related)}"
+    debug_data["4_Final_Schema_Context"] = schema_context
+    debug_data["4a_Schema_Context_Tokens"]["used"] = tokenizer.count_tokens(schema_context)
+    return schema_context, debug_data
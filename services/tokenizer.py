@@ -0,0 +1,39 @@
+# services/tokenizer.py
+
+import os
+import threading
+
+TIKTOKEN_ENCODING = os.environ.get("TIKTOKEN_ENCODING", "o200k_base")
+CHARS_PER_TOKEN = 4     # Roughly four characters per token for English prose and Apex code
+
+_lock = threading.Lock()
+_encoding = None
+_encoding_loaded = False
+
+def _get_encoding():
+    """
+    The tiktoken encoding, or None when tiktoken isn't installed or its encoding file
+    can't be loaded (it is downloaded once, then read from TIKTOKEN_CACHE_DIR; air-gapped
+    hosts without a pre-seeded cache fall back to the estimate). Only tried once.
+    """
+    global _encoding, _encoding_loaded
+    with _lock:
+        if not _encoding_loaded:
+            _encoding_loaded = True
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding(TIKTOKEN_ENCODING)
+            except Exception:
+                _encoding = None
+    return _encoding
+
+def count_tokens(text):
+    """Token count of text: exact with tiktoken, otherwise a characters/4 estimate."""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def describe():
+    """Which tokenizer count_tokens() is using, for debug output."""
+    return f"tiktoken:{TIKTOKEN_ENCODING}" if _get_encoding() is not None else f"estimate:chars/{CHARS_PER_TOKEN}"
@@ -0,0 +1,48 @@
+# services/vector_store.py
+
+import streamlit as st
+# The index settings are shared with cache_builder.py, which builds the index.
+from services.cache_common import (
+    PINECONE_INDEX_NAME, EMBEDDING_MODEL, DEFAULT_LOCAL_INDEX_PATH, is_local_store_configured
+)
+from services.local_vector_index import LocalVectorIndex
+
+# --- CONFIGURATION ---
+MAX_QUERY_CHARS = 24000         # Keeps long pasted stories under the embedding model's input limit
+
+@st.cache_resource(show_spinner=False)
+def get_metadata_index():
+    """
+    Returns the metadata index built by cache_builder.py: Pinecone by default, or the
+    on-disk LocalVectorIndex when VECTOR_STORE = "local". Anything exposing the same
+    query(vector=, top_k=, filter=, include_metadata=) call can stand in for it.
+    """
+    if is_local_store_configured(st.secrets):
+        return LocalVectorIndex(st.secrets.get("LOCAL_INDEX_PATH", DEFAULT_LOCAL_INDEX_PATH))
+    from pinecone import Pinecone
+    return Pinecone(api_key=st.secrets["PINECONE_API_KEY"]).Index(PINECONE_INDEX_NAME)
+
+@st.cache_resource(show_spinner=False)
+def _get_embedding_client():
+    from openai import OpenAI
+    return OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+
+def embed_query(text):
+    """
+    Embeds a piece of text (e.g. a user story) with the same model used to build the index.
+    """
+    response = _get_embedding_client().embeddings.create(input=[text[:MAX_QUERY_CHARS]], model=EMBEDDING_MODEL)
+    return response.data[0].embedding
+
+def query_metadata(index, vector, metadata_types, top_k):
+    """
+    Returns [(name, type, score)] for the closest documents of the given metadata types.
+    """
+    response = index.query(
+        vector=vector, top_k=top_k, include_metadata=True,
+        filter={"type": {"$in": list(metadata_types)}}
+    )
+    return [
+        (match["metadata"]["name"], match["metadata"]["type"], match["score"])
+        for match in response["matches"]
+    ]
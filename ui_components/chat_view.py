@@ -2,10 +2,20 @@
 
 import streamlit as st
 import re
+from services import conversation
 
 # We dynamically import the correct AI service in the main app.py file
 # and pass it to this render function.
 
+def _stream_reply(ai_service):
+    """
+    Streams the assistant's reply to the conversation so far. Only the recent turns are
+    sent verbatim; older ones reach the model through the rolling summary.
+    """
+    manager = st.session_state.setdefault("conversation_manager", conversation.ConversationManager())
+    window, summary = manager.prepare(st.session_state.messages, ai_service.summarize_conversation)
+    return st.write_stream(ai_service.stream_chat_response(window, summary))
+
 def render(ai_service):
     """
     Renders the chat UI and handles the conversational logic.
@@ -35,7 +45,8 @@ def render(ai_service):
                 story_content = uploaded_file.getvalue().decode("utf-8")
                 contextual_prompt = f"Here is the user story from the uploaded file '{uploaded_file.name}':\n\n---\n{story_content}\n---\n\nPlease analyze this story and generate a Solution Overview."
                 st.session_state.messages.append({"role": "user", "content": contextual_prompt})
-                response = ai_service.get_chat_response(st.session_state.messages)
+                with st.chat_message("assistant"):
+                    response = _stream_reply(ai_service)
                 st.session_state.messages.append({"role": "assistant", "content": response})
             except Exception as e:
                 st.session_state.messages.append({"role": "assistant", "content": f"Sorry, I couldn't read the file. Error: {e}"})
@@ -48,24 +59,30 @@ def render(ai_service):
             st.markdown(prompt)
 
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                jira_match = re.search(r"([A-Z]+-[0-9]+)", prompt.upper())
-                
-                if jira_match:
-                    ticket_id = jira_match.group(1)
-                    story_text = jira_service.fetch_story(ticket_id)
-                    if story_text:
-                        contextual_prompt = f"Here is the user story from Jira ticket {ticket_id}:\n\n---\n{story_text}\n---\n\nPlease analyze this story and generate a Solution Overview."
-                        st.session_state.messages.append({"role": "user", "content": contextual_prompt})
-                        response = ai_service.get_chat_response(st.session_state.messages)
-                    else:
-                        response = f"Sorry, I couldn't fetch the details for {ticket_id}."
+            ticket_ids = list(dict.fromkeys(re.findall(r"([A-Z]+-[0-9]+)", prompt.upper())))
+
+            if ticket_ids:
+                # Every ticket mentioned is resolved in a single Jira search.
+                with st.spinner(f"Fetching {', '.join(ticket_ids)} from Jira..."):
+                    stories = jira_service.fetch_stories(ticket_ids)
+                if stories:
+                    story_blocks = "\n\n".join(f"Jira ticket {ticket_id}:\n---\n{story_text}\n---" for ticket_id, story_text in stories.items())
+                    noun = "story" if len(stories) == 1 else "stories"
+                    contextual_prompt = f"Here is the user {noun} from Jira:\n\n{story_blocks}\n\nPlease analyze this {noun} and generate a Solution Overview."
+                    missing = [ticket_id for ticket_id in ticket_ids if ticket_id not in stories]
+                    if missing:
+                        contextual_prompt += f"\n\n(These tickets could not be fetched: {', '.join(missing)}.)"
+                    st.session_state.messages.append({"role": "user", "content": contextual_prompt})
+                    response = _stream_reply(ai_service)
                 else:
-                    response = ai_service.get_chat_response(st.session_state.messages)
-                
-                st.markdown(response)
-                st.session_state.messages.append({"role": "assistant", "content": response})
-                
-                if "last_uploaded_file" in st.session_state:
-                    del st.session_state.last_uploaded_file
-                st.rerun()
\ No newline at end of file
+                    response = f"Sorry, I couldn't fetch the details for {', '.join(ticket_ids)}."
+                    st.markdown(response)
+            else:
+                # Tokens render as they arrive; the Stop button cancels the request mid-stream.
+                response = _stream_reply(ai_service)
+
+            st.session_state.messages.append({"role": "assistant", "content": response})
+
+            if "last_uploaded_file" in st.session_state:
+                del st.session_state.last_uploaded_file
+            st.rerun()
\ No newline at end of file